@@ -0,0 +1,304 @@
+#benchmarks.py
+#
+#Benchmarks
+#   Times the slow bits of images.py and rectangles.py on made up
+#   images and quadrilaterals, with no display needed. Results are
+#   saved as JSON, and can be compared to an older run to catch
+#   anything that got slower.
+#
+#   python benchmarks.py --output now.json
+#   python benchmarks.py --compare now.json
+#
+#Edit History:
+#   [001]   ag  10/17/26    Initial Creation
+#   [002]   ag  10/17/26    Added the mesh mapping benchmarks.
+#   [003]   ag  10/17/26    Added a transform_onto benchmark.
+#   [004]   ag  10/17/26    Added scene benchmarks.
+
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import sys
+import json
+import time
+import math
+import random
+import platform
+import argparse
+import tempfile
+import statistics
+import numpy
+from PIL import Image as Img
+import pygame
+import rectangles
+import images
+
+_SEED = 1220
+_SIZES = [64, 256, 1024]
+_QUICK_SIZES = [64, 256]
+_ALIASES = [1, 2, 4]
+_REPEATS = 5
+_MIN_TIME = .05
+_THRESHOLD = .25
+_PALETTE_COLORS = 16
+_SCENE_SPRITES = 200
+
+def synthetic_pixels(width: int, height: int, seed: int = _SEED) -> numpy.ndarray:
+    '''
+    Makes a height x width x 4 image that isn't just noise (so palettes and
+    transforms have something real to chew on): smooth gradients, some
+    blocks of flat color, a bit of noise, and a fully blank border.
+    '''
+    rng = numpy.random.default_rng(seed)
+    ys, xs = numpy.mgrid[0:height, 0:width]
+    pixels = numpy.zeros((height, width, 4), dtype = numpy.uint8)
+    pixels[..., 0] = xs*255//max(1, width-1)
+    pixels[..., 1] = ys*255//max(1, height-1)
+    pixels[..., 2] = (xs//8 + ys//8) % 2 * 200
+    pixels[..., :3] ^= rng.integers(0, 16, (height, width, 3), dtype = numpy.uint8)
+    pixels[..., 3] = 255
+    border = max(1, min(width, height)//16)
+    pixels[:border] = 0
+    pixels[-border:] = 0
+    pixels[:, :border] = 0
+    pixels[:, -border:] = 0
+    return pixels
+
+def synthetic_colors(pixels: numpy.ndarray, size: int = _PALETTE_COLORS,
+                     seed: int = _SEED, old: bool = False) -> [images.Color]:
+    '''
+    Picks size colors from pixels, as old (5/6/5 bit) colors if old.
+    '''
+    rng = numpy.random.default_rng(seed)
+    colors = pixels.reshape(-1, 4)[rng.choice(pixels.shape[0]*pixels.shape[1], size, replace = False)]
+    colors = [images.Color(int(r), int(g), int(b)) for r, g, b, _ in colors]
+    return [c.to_old() for c in colors] if old else colors
+
+def synthetic_palette(pixels: numpy.ndarray, size: int = _PALETTE_COLORS,
+                      seed: int = _SEED, old: bool = False) -> images.Palette:
+    '''
+    Makes a palette out of size colors picked from pixels (see synthetic_colors).
+    Palettes keep every lookup they work out, so time with a new one (made from
+    the same colors) to include working out the closest colors.
+    '''
+    return images.Palette(*synthetic_colors(pixels, size, seed, old))
+
+def synthetic_quad(width: int, height: int, seed: int = _SEED) -> [(float, float)]:
+    '''
+    Makes a convex, rotated and skewed quadrilateral about as big as a width
+    by height image, as (top left, top right, bottom right, bottom left) points.
+    '''
+    rng = random.Random(seed)
+    angle = rng.uniform(.2, .6)
+    cx = width
+    cy = height
+    corners = [(-width/2, -height/2), (width/2, -height/2), (width/2, height/2), (-width/2, height/2)]
+    points = []
+    for x, y in corners:
+        x *= rng.uniform(.85, 1.15)
+        y *= rng.uniform(.85, 1.15)
+        points.append((cx + x*math.cos(angle) - y*math.sin(angle),
+                       cy + x*math.sin(angle) + y*math.cos(angle)))
+    return points
+
+def draw_sprites(sprites: [(images.Image, [(float, float)])], width: int, height: int) -> images.Image:
+    '''
+    Draws sprites one at a time with transform_onto, to compare render_scene to.
+    '''
+    canvas = images.Image(pixels = numpy.zeros((height, width, 4), dtype = numpy.uint8))
+    for image, quad in sprites:
+        image.transform_onto(canvas, quad, alias_amount = 2)
+    return canvas
+
+def measure(f: 'function', repeats: int = _REPEATS,
+            min_time: float = _MIN_TIME) -> dict:
+    '''
+    Times f, calling it repeats times (after one warm up call), each time
+    enough times in a row to take at least min_time. Returns the best and
+    median seconds per call.
+    '''
+    f()
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            f()
+        took = time.perf_counter() - start
+        if took >= min_time or loops >= 1 << 20:
+            break
+        loops *= 2
+    times = [took/loops]
+    for _ in range(repeats-1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            f()
+        times.append((time.perf_counter()-start)/loops)
+    return {'min': min(times), 'median': statistics.median(times), 'loops': loops, 'repeats': repeats}
+
+def benchmarks(folder: str, sizes: [int] = _SIZES, aliases: [int] = _ALIASES) -> {str: 'function'}:
+    '''
+    Makes every benchmark (name to function to time) for the given sizes
+    and alias amounts, saving whatever files they need into folder.
+    '''
+    cases = {}
+    for size in sizes:
+        pixels = synthetic_pixels(size, size)
+        image = images.Image(pixels = pixels)
+        path = os.path.join(folder, f'synthetic_{size}.png')
+        Img.fromarray(pixels, 'RGBA').save(path)
+        raw_path = os.path.join(folder, f'synthetic_{size}.raw')
+        image.save_raw(raw_path)
+        palette = synthetic_palette(pixels)
+        other = synthetic_palette(pixels, seed = _SEED+1)
+        swapped = images.Image(pixels = image.apply_palette(palette).pixels())
+        quad = synthetic_quad(size, size)
+
+        cases[f'load/pil/{size}'] = lambda path = path: images.Image.load(path, images.PIL)
+        cases[f'load/pygame/{size}'] = lambda path = path: images.Image.load(path, images.PYGAME)
+        cases[f'load/raw/{size}'] = lambda path = raw_path: images.Image.load(path, images.RAW)
+        cases[f'convert/pil/{size}'] = lambda image = image: image.convert(images.PIL)
+        cases[f'convert/pygame/{size}'] = lambda image = image: image.convert(images.PYGAME)
+        for alias in aliases:
+            cases[f'transform/quad/{size}/alias{alias}'] = \
+                lambda image = image, quad = quad, alias = alias: image.transform(quad, alias_amount = alias)
+        cases[f'transform/projective/{size}/alias2'] = \
+            lambda image = image, quad = quad: image.transform(quad, alias_amount = 2, mode = rectangles.PROJECTIVE)
+        cases[f'transform/bilinear/{size}'] = \
+            lambda image = image, quad = quad: image.transform(quad, alias_amount = 1, filter = images.BILINEAR)
+        cases[f'transform/mesh/{size}/alias2'] = \
+            lambda image = image, quad = quad: image.transform(quad, alias_amount = 2, mesh = rectangles.MESH_ERROR)
+        canvas = images.Image(pixels = synthetic_pixels(size*2, size*2, _SEED+1))
+        cases[f'transform/onto/{size}/alias2'] = \
+            lambda image = image, quad = quad, canvas = canvas: image.transform_onto(canvas, quad, alias_amount = 2)
+        cases[f'scale/up2/{size}'] = lambda image = image: image.scale(2)
+        cases[f'scale/down4/{size}'] = lambda image = image: image.scale(.25, alias_amount = 4)
+        cases[f'scale/down4/mipmap/{size}'] = \
+            lambda image = image: image.scale(.25, filter = images.BILINEAR, mipmap = True)
+        #The warm cases reuse palettes that already have every lookup they need,
+        #the cold ones make new palettes each time so the closest colors get searched
+        colors = synthetic_colors(pixels)
+        other_colors = synthetic_colors(pixels, seed = _SEED+1)
+        old_colors = synthetic_colors(pixels, old = True)
+        cases[f'apply_palette/{size}'] = lambda image = image, palette = palette: image.apply_palette(palette)
+        cases[f'apply_palette/cold/{size}'] = \
+            lambda image = image, colors = colors: image.apply_palette(images.Palette(*colors))
+        cases[f'apply_palette/old/cold/{size}'] = \
+            lambda image = image, colors = old_colors: image.apply_palette(images.Palette(*colors))
+        cases[f'palette_swap/{size}'] = \
+            lambda swapped = swapped, palette = palette, other = other: \
+                images.Image(pixels = swapped.pixels().copy()).palette_swap(palette, other)
+        cases[f'palette_swap/cold/{size}'] = \
+            lambda swapped = swapped, colors = colors, other_colors = other_colors: \
+                images.Image(pixels = swapped.pixels().copy()).palette_swap(images.Palette(*colors),
+                                                                            images.Palette(*other_colors))
+        if size <= 256:
+            palettes = [synthetic_palette(pixels, seed = _SEED+i) for i in range(4)]
+            all_colors = [synthetic_colors(pixels, seed = _SEED+i) for i in range(4)]
+            cases[f'test_many_palettes/{size}'] = \
+                lambda image = image, palettes = palettes: image.test_many_palettes(*palettes)
+            cases[f'test_many_palettes/cold/{size}'] = \
+                lambda image = image, all_colors = all_colors: \
+                    image.test_many_palettes(*(images.Palette(*colors) for colors in all_colors))
+
+    rng = random.Random(_SEED)
+    sprite_images = [images.Image(pixels = synthetic_pixels(size, size, _SEED+size)) for size in (32, 64, 128)]
+    sprites = []
+    #Crowded enough that they cover the canvas about twice over, like a real scene
+    for _ in range(_SCENE_SPRITES):
+        image = rng.choice(sprite_images)
+        x = rng.uniform(-image.width()/2, 1024-3*image.width()/2)
+        y = rng.uniform(-image.height()/2, 768-3*image.height()/2)
+        sprites.append((image, [(x+px, y+py) for px, py in synthetic_quad(image.width(), image.height(),
+                                                                          rng.randrange(1 << 30))]))
+    cases['scene/render_scene'] = lambda: images.Image.render_scene(sprites, 1024, 768, alias_amount = 2)
+    cases['scene/transform_onto'] = lambda: draw_sprites(sprites, 1024, 768)
+
+    quad = synthetic_quad(256, 256)
+    rect = rectangles.Rectangle([rectangles.Coordinate(tuple_coord = p) for p in quad])
+    source = rectangles.Rectangle(width = 256, height = 256)
+    mapping = rect.mapping(source)
+    point = rectangles.Coordinate(*quad[0])
+    point.x += 20
+    point.y += 40
+    xs, ys = numpy.meshgrid(numpy.arange(0, 512, 2, dtype = float), numpy.arange(0, 512, 2, dtype = float))
+    cases['rectangles/contains'] = lambda: rect.contains(point)
+    cases['rectangles/transform'] = lambda: rect.transform(point, source)
+    cases['rectangles/mapping'] = lambda: rect.mapping(source)
+    cases['rectangles/mapping/map'] = lambda: mapping.map(point)
+    cases['rectangles/contains_many'] = lambda: rect.contains_many(xs, ys)
+    cases['rectangles/mapping/map_array'] = lambda: mapping.map_array(xs, ys)
+    cases['rectangles/mapping/spans'] = lambda: mapping.spans(ys[:, 0])
+    inside = mapping.contains_array(xs[0][None, :], ys[:, 0][:, None])
+    mesh = rectangles.MeshMapping(mapping)
+    cases['rectangles/mesh'] = lambda: rectangles.MeshMapping(mapping)
+    cases['rectangles/mapping/map_grid'] = lambda: mapping.map_grid(xs[0], ys[:, 0], inside)
+    cases['rectangles/mesh/map_grid'] = lambda: mesh.map_grid(xs[0], ys[:, 0], inside)
+    #Small enough that no grid square ever gets close, so everything is mapped exactly
+    small = images.Image(pixels = synthetic_pixels(64, 64))
+    small_quad = [(5, 20), (10, 10), (20, 5), (25, 15)]
+    cases['transform/mesh/small'] = lambda: small.transform(small_quad, mesh = rectangles.MESH_ERROR)
+    return cases
+
+def run(sizes: [int] = _SIZES, aliases: [int] = _ALIASES, only: str = None,
+        repeats: int = _REPEATS, verbose: bool = True) -> dict:
+    '''
+    Runs every benchmark (whose name has only in it, if given) and returns
+    the results along with what they were run on.
+    '''
+    images.set_sample_cache_size(0)
+    pygame.display.init()
+    pygame.display.set_mode((1, 1))
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            for name, f in benchmarks(folder, sizes, aliases).items():
+                if only != None and only not in name:
+                    continue
+                results[name] = measure(f, repeats)
+                if verbose:
+                    print(f'{name:<40} {results[name]["median"]*1000:10.3f} ms')
+    finally:
+        pygame.display.quit()
+    return {'machine': {'python': platform.python_version(), 'numpy': numpy.__version__,
+                        'platform': platform.platform(), 'processor': platform.processor(),
+                        'cpus': os.cpu_count()},
+            'results': results}
+
+def compare(old: dict, new: dict, threshold: float = _THRESHOLD) -> [(str, float, float)]:
+    '''
+    Compares the median times of two runs, and returns (name, old, new) for
+    every benchmark that got more than threshold (as a fraction) slower.
+    '''
+    regressions = []
+    for name, result in new['results'].items():
+        before = old['results'].get(name)
+        if before != None and result['median'] > before['median']*(1+threshold):
+            regressions.append((name, before['median'], result['median']))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Times images.py and rectangles.py.')
+    parser.add_argument('--output', help = 'save the results to this JSON file')
+    parser.add_argument('--compare', help = 'JSON results of an older run to check for regressions against')
+    parser.add_argument('--threshold', type = float, default = _THRESHOLD,
+                        help = 'how much slower (as a fraction) counts as a regression')
+    parser.add_argument('--only', help = 'only run benchmarks with this in their names')
+    parser.add_argument('--repeats', type = int, default = _REPEATS)
+    parser.add_argument('--quick', action = 'store_true', help = 'skip the biggest images')
+    args = parser.parse_args()
+
+    results = run(_QUICK_SIZES if args.quick else _SIZES, _ALIASES, args.only, args.repeats)
+    if args.output != None:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent = 2)
+    if args.compare != None:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(baseline, results, args.threshold)
+        for name, before, after in regressions:
+            print(f'REGRESSION {name}: {before*1000:.3f} ms -> {after*1000:.3f} ms ({after/before:.2f}x)')
+        if regressions:
+            sys.exit(1)
+        print('No regressions')
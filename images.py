@@ -13,6 +13,53 @@
 #                           compatible with floats. Optimization 
 #                           inbound, but for now, you can just do
 #                           aliasing at like .1 lol.
+#   [004]   ag  10/17/26    Image now stores its pixels as one
+#                           height x width x 4 uint8 numpy array
+#                           instead of a list of lists of Colors.
+#   [005]   ag  10/17/26    transform uses a precomputed rectangles
+#                           mapping, and can do projective warps.
+#   [006]   ag  10/17/26    Anti-aliasing is now vectorized: every
+#                           sample is mapped in one go and averaged
+#                           with numpy.
+#   [007]   ag  10/17/26    transform can be split into tiles over a
+#                           pool of threads or processes (workers).
+#   [008]   ag  10/17/26    transform_bands and transform_to_file
+#                           stream a transform out band by band.
+#   [009]   ag  10/17/26    A view now crops the transform down to
+#                           just the view, and only renders that.
+#   [010]   ag  10/17/26    transform scanlines the rectangle, so only
+#                           samples inside of it get mapped.
+#   [011]   ag  10/17/26    Adaptive anti-aliasing, which only takes
+#                           every sample for pixels that need it.
+#   [012]   ag  10/17/26    Palettes find closest colors with lookup
+#                           tables, so apply_palette is vectorized.
+#   [013]   ag  10/17/26    Palettes map packed colors to indices for
+#                           vectorized palette swaps.
+#   [014]   ag  10/17/26    test_many_palettes makes its sheet in one
+#                           pass instead of chaining add_right/add_down.
+#   [015]   ag  10/17/26    Image.mosaic builds atlases in one buffer.
+#   [016]   ag  10/17/26    Color has __slots__ and a trusted
+#                           constructor, and ColorArray packs many
+#                           colors into one array.
+#   [017]   ag  10/17/26    Transform sample grids are kept in a least
+#                           recently used cache.
+#   [018]   ag  10/17/26    transform_batch warps a stack of frames
+#                           through one mapping.
+#   [019]   ag  10/17/26    transform can filter samples bilinearly
+#                           or bicubically instead of nearest neighbour.
+#   [020]   ag  10/17/26    Images keep a lazily made mipmap pyramid,
+#                           which transform can read from when shrinking.
+#   [021]   ag  10/17/26    load and convert go through the libraries'
+#                           buffers instead of pixel by pixel.
+#   [022]   ag  10/17/26    Raw image files, which load memory mapped.
+#   [023]   ag  10/17/26    The _DEBUG prints are gone, calls can be
+#                           timed and counted through stats and hooks.
+#   [024]   ag  10/17/26    transform can approximate the mapping with
+#                           an interpolated mesh (mesh = max error).
+#   [025]   ag  10/17/26    transform_onto draws a transform straight
+#                           onto another Image, blending by alpha.
+#   [026]   ag  10/17/26    render_scene draws many sprites at once,
+#                           skipping the bits hidden behind others.
 
 import rectangles
 from PIL import Image as Img 
@@ -21,15 +68,40 @@ import numpy
 import time
 import struct
 import math
+import collections
+import threading
+import mmap
+import contextlib
+from concurrent import futures
+from multiprocessing import shared_memory
 
 _EXAMPLE_IMG = 'pusheen.png'
 _EXAMPLE_SAVE = 'edited.png'
-_DEBUG = True
 
 PYGAME = 'pygame'
 PIL = 'PIL'
+RAW = 'raw'
+
+THREADS = 'threads'
+PROCESSES = 'processes'
+
+GRID = 'grid'
+ROWS = 'rows'
+SHELF = 'shelf'
+
+NEAREST = 'nearest'
+BILINEAR = 'bilinear'
+BICUBIC = 'bicubic'
+
+_BYTE = 0xFF
+
+#Raw images are this header (magic, width, height, padding) then the RGBA pixels
+_RAW_HEADER = struct.Struct('<4sII4x')
+_RAW_MAGIC = b'RGBA'
 
 class Color:
+    __slots__ = ('r', 'g', 'b', 'a', '_blends', '_old')
+
     def __init__(self, r: int, g: int, b: int, a: int = 255, old = False):
         self.r = max(0,min(r,31 if old else 255))
         self.g = max(0,min(g,63 if old else 255))
@@ -38,6 +110,21 @@ class Color:
         self._blends = 0
         self._old = old
 
+    @staticmethod
+    def trusted(r: int, g: int, b: int, a: int = 255, old = False) -> 'Color':
+        '''
+        Makes a color without clamping anything, for when the values
+        are already known to be in range (alpha is still 255 if old).
+        '''
+        c = Color.__new__(Color)
+        c.r = r
+        c.g = g
+        c.b = b
+        c.a = 255 if old else a
+        c._blends = 0
+        c._old = old
+        return c
+
     @staticmethod
     def int_to_color(value: int, ignore_last = True) -> 'Color':
         '''
@@ -45,11 +132,11 @@ class Color:
         in the int to construct a color. Last byte ignored
         and converted to alpha of 255 if ignore_last.
         '''
-        r = (value >> 0) & int("11111111",2)
-        g = (value >> 8) & int("11111111",2)
-        b = (value >> 16) & int("11111111",2)
-        a = 255 if ignore_last else ((value >> 24) & int("11111111",2))
-        return Color(r,g,b,a)
+        r = (value >> 0) & _BYTE
+        g = (value >> 8) & _BYTE
+        b = (value >> 16) & _BYTE
+        a = 255 if ignore_last else ((value >> 24) & _BYTE)
+        return Color.trusted(r,g,b,a)
 
 
     def blank(self) -> bool:
@@ -117,7 +204,7 @@ class Color:
             b += i.b
             a += i.a
         num = len(c) + filler
-        return Color(r//num,g//num,b//num,a//num) 
+        return Color.trusted(r//num,g//num,b//num,a//num) 
 
     def blend(self, c: 'Color' or ['Color']) -> None:
         '''
@@ -163,12 +250,12 @@ class Color:
         return self.r, self.g, self.b, self.a
 
     def to_old(self) -> 'Color':
-        if self._old: return Color(self.r, self.g,self.b, old = True)
-        return Color(self.r//8, self.g//4,self.b//8, old = True)
+        if self._old: return Color.trusted(self.r, self.g,self.b, old = True)
+        return Color.trusted(self.r//8, self.g//4,self.b//8, old = True)
 
     def to_new(self) -> 'Color':
-        if not self._old: return Color(self.r, self.g, self.b ,self.a)
-        return Color(self.r*8, self.g*4, self.b*8)
+        if not self._old: return Color.trusted(self.r, self.g, self.b ,self.a)
+        return Color.trusted(self.r*8, self.g*4, self.b*8)
 
     def is_old(self):# -> bool:
         return self._old
@@ -186,6 +273,111 @@ class Color:
         elif index == 3: return self.a
 
 
+class ColorArray:
+    '''
+    A whole bunch of colors packed into one N x 4 (RGBA) uint8 array, so each
+    is just 4 bytes, with Color's math done on all of them at once.
+    '''
+    def __init__(self, colors: [Color] = None, values: numpy.ndarray = None,
+                 old: bool = None):
+        '''
+        Make it from a list of Colors or straight from an N x 4 array of values.
+        Old (by default only if the first color is) makes them all old colors.
+        Values are clamped like Color does (0-255, or 31/63/31 with a solid
+        alpha if old), and new uint8 values are used as is.
+        '''
+        if values is None:
+            colors = colors or []
+            if old == None:
+                old = len(colors) != 0 and colors[0].is_old()
+            values = [(c.to_old() if old else c.to_new()).to_tuple() for c in colors]
+        old = bool(old)
+        values = numpy.asarray(values)
+        if values.dtype != numpy.uint8 or old:
+            values = numpy.clip(values.reshape(-1, 4), 0, [31, 63, 31, 255] if old else 255).astype(numpy.uint8)
+            if old:
+                values[:, 3] = 255
+        self._values = values.reshape(-1, 4)
+        self._old = old
+
+    @staticmethod
+    def from_packed(packed: numpy.ndarray, old: bool = False) -> 'ColorArray':
+        '''
+        Makes a ColorArray from packed uint32 colors (red in the lowest byte).
+        '''
+        return ColorArray(values = _unpack(packed), old = old)
+
+    def packed(self) -> numpy.ndarray:
+        '''
+        Returns every color packed into a uint32 (red in the lowest byte).
+        '''
+        return _pack(self._values)
+
+    def values(self) -> numpy.ndarray:
+        '''
+        Returns the N x 4 uint8 array backing this. Not a copy.
+        '''
+        return self._values
+
+    def is_old(self) -> bool:
+        return self._old
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, index: int) -> Color:
+        return Color.trusted(*self._values[index].tolist(), old = self._old)
+
+    def __str__(self):
+        return 'ColorArray('+str([tuple(c) for c in self._values.tolist()])+')'
+
+    def __repr__(self):
+        return str(self)
+
+    def to_colors(self) -> [Color]:
+        '''
+        Returns every color as a Color.
+        '''
+        return [Color.trusted(*c, old = self._old) for c in self._values.tolist()]
+
+    def average_list(self, filler: int = 0) -> Color:
+        '''
+        Same as Color.average_list on all of these colors.
+        '''
+        num = len(self._values) + filler
+        if num == 0:
+            return Color(0,0,0,0)
+        return Color.trusted(*(self._values.sum(axis = 0, dtype = numpy.int64)//num).tolist())
+
+    def blend_percent(self, c: 'Color or ColorArray', percent: float) -> None:
+        '''
+        Same as Color.blend_percent on every color, with either one color
+        or a ColorArray of as many colors.
+        '''
+        other = c._values if isinstance(c, ColorArray) else numpy.array(c.to_tuple())
+        self._values[:] = (self._values*(1-percent) + other*percent).astype(numpy.uint8)
+
+    def distance_no_sqrt(self, c: 'Color or ColorArray') -> numpy.ndarray:
+        '''
+        Same as Color.distance_no_sqrt from every color to either one color
+        or a ColorArray of as many colors.
+        '''
+        other = c._values if isinstance(c, ColorArray) else numpy.array(c.to_tuple())
+        return _distance_no_sqrt(self._values.astype(numpy.int32), other.astype(numpy.int32))
+
+    def to_old(self) -> 'ColorArray':
+        if self._old: return ColorArray(values = self._values.copy(), old = True)
+        values = self._values//numpy.array([8, 4, 8, 1], dtype = numpy.uint8)
+        values[:, 3] = 255
+        return ColorArray(values = values, old = True)
+
+    def to_new(self) -> 'ColorArray':
+        if not self._old: return ColorArray(values = self._values.copy())
+        values = self._values*numpy.array([8, 4, 8, 1], dtype = numpy.uint8)
+        values[:, 3] = 255
+        return ColorArray(values = values)
+
+
 class Palette:
     '''
     Note that this is primarily for palette swaps, and in specific, for palette swaps
@@ -200,6 +392,16 @@ class Palette:
         self._old = False
         if colors[0].is_old(): self._old = True
         self._colors = colors
+        self._values = numpy.array([c.to_tuple() for c in colors], dtype = numpy.int32)
+        self._new_colors = numpy.array([c.to_new().to_tuple() for c in colors], dtype = numpy.uint8)
+        #Closest color lookups, built as they're needed. Old palettes get a table of
+        #every old color, new ones a sorted cache of the packed colors seen so far
+        self._table = None
+        self._cache_keys = numpy.zeros(0, dtype = numpy.uint32)
+        self._cache_indices = numpy.zeros(0, dtype = numpy.intp)
+        #Packed color -> index maps (as sorted keys and their indices) for swaps,
+        #one for the palette's new colors and one for its old ones
+        self._swap_maps = None
 
     @staticmethod
     def poke_gen3_palette(file: str) -> 'Palette':
@@ -224,9 +426,50 @@ class Palette:
             return self._colors[0]
         elif isinstance(index, Color):
             if index.a == 0: return self._colors[0]
-            color_using = index.to_old() if self._old else index.to_new()
-            closest = min(self._colors[1:], key = lambda x: x.distance_no_sqrt(color_using))
-            return closest
+            color = numpy.array([index.to_new().to_tuple()], dtype = numpy.uint8)
+            return self._colors[self.closest_indices(color)[0]]
+
+    def new_colors(self) -> numpy.ndarray:
+        '''
+        Returns the palette's colors as new (0-255) colors, in a
+        number of colors x 4 (RGBA) uint8 array.
+        '''
+        return self._new_colors
+
+    def closest_indices(self, pixels: numpy.ndarray) -> numpy.ndarray:
+        '''
+        Takes an array of new (0-255) RGBA pixels (... x 4) and gives back the index
+        of each one's closest color in the palette, same as indexing with a Color.
+        '''
+        pixels = numpy.asarray(pixels)
+        if self._old:
+            if self._table is None:
+                self._table = self._closest(_every_old_color()).reshape(32, 64, 32)
+            indices = self._table[pixels[..., 0]//8, pixels[..., 1]//4, pixels[..., 2]//8]
+        else:
+            keys, inverse = numpy.unique(_pack(pixels).ravel(), return_inverse = True)
+            missing = numpy.ones(len(keys), dtype = bool)
+            if len(self._cache_keys):
+                found = numpy.minimum(numpy.searchsorted(self._cache_keys, keys), len(self._cache_keys)-1)
+                missing = self._cache_keys[found] != keys
+            if missing.any():
+                self._cache_keys = numpy.concatenate([self._cache_keys, keys[missing]])
+                self._cache_indices = numpy.concatenate([self._cache_indices,
+                                                         self._closest(_unpack(keys[missing]))])
+                order = numpy.argsort(self._cache_keys)
+                self._cache_keys = self._cache_keys[order]
+                self._cache_indices = self._cache_indices[order]
+            indices = self._cache_indices[numpy.searchsorted(self._cache_keys, keys)][inverse]
+            indices = indices.reshape(pixels.shape[:-1])
+        return numpy.where(pixels[..., 3] == 0, 0, indices)
+
+    def _closest(self, colors: numpy.ndarray) -> numpy.ndarray:
+        '''
+        Takes an array of N colors (N x 4) already in the palette's color size, and
+        returns the index of the closest color to each, excluding the transparent one.
+        '''
+        distances = _distance_no_sqrt(self._values[None, 1:], colors[:, None].astype(numpy.int32))
+        return numpy.argmin(distances, axis = 1) + 1
 
     def __str__(self):
         return 'Palette('+('3byte' if self._old else '6/8byte')+'):\n'+str(self._colors)
@@ -237,109 +480,262 @@ class Palette:
         If the color is not on the current palette, returns the new palette's
         transparency (first) color.
         '''
-        for i in range(len(self._colors)):
-            if self._colors[i] == c:
-                return p[i]
-        return p[0]
+        i = self.indices_of(numpy.array([c.to_new().to_tuple()], dtype = numpy.uint8))[0]
+        return p[int(i)] if i >= 0 else p[0]
 
+    def swap_pixels(self, pixels: numpy.ndarray, p: 'new palette') -> numpy.ndarray:
+        '''
+        Same as swap_color, but over an array of new (0-255) RGBA pixels (... x 4).
+        Gives back the swapped pixels as a new uint8 array.
+        '''
+        indices = self.indices_of(pixels)
+        indices = numpy.where((indices >= 0) & (indices < len(p._colors)), indices, 0)
+        return p._values.astype(numpy.uint8)[indices]
 
+    def indices_of(self, pixels: numpy.ndarray) -> numpy.ndarray:
+        '''
+        Takes an array of new (0-255) RGBA pixels (... x 4) and gives back the index
+        of the first palette color equal to each one (see Color.__eq__), or -1 if
+        it isn't in the palette.
+        '''
+        if self._swap_maps is None:
+            self._swap_maps = []
+            for old in (False, True):
+                indices = numpy.array([i for i in range(len(self._colors))
+                                       if self._colors[i].is_old() == old], dtype = numpy.intp)
+                #Sorting stably keeps the first of any repeated colors first
+                keys = _pack(self._values[indices])
+                order = numpy.argsort(keys, kind = 'stable')
+                keys, first = numpy.unique(keys[order], return_index = True)
+                self._swap_maps.append((old, keys, indices[order][first]))
+
+        pixels = numpy.asarray(pixels)
+        keys, inverse = numpy.unique(_pack(pixels).ravel(), return_inverse = True)
+        found = numpy.full(len(keys), -1, dtype = numpy.intp)
+        for old, map_keys, map_indices in self._swap_maps:
+            if len(map_keys) == 0:
+                continue
+            looking_for = keys
+            if old:
+                colors = _unpack(keys)
+                looking_for = _pack(numpy.stack([colors[:, 0]//8, colors[:, 1]//4, colors[:, 2]//8,
+                                                 numpy.full(len(keys), 255)], axis = -1))
+            position = numpy.minimum(numpy.searchsorted(map_keys, looking_for), len(map_keys)-1)
+            matched = map_keys[position] == looking_for
+            better = matched & ((found == -1) | (map_indices[position] < found))
+            found = numpy.where(better, map_indices[position], found)
+        return found[inverse].reshape(pixels.shape[:-1])
+
+
+
+def _pack(colors: numpy.ndarray) -> numpy.ndarray:
+    '''
+    Packs RGBA colors (... x 4) into single uint32s, red in the lowest byte.
+    '''
+    colors = numpy.asarray(colors).astype(numpy.uint32)
+    return colors[..., 0] | colors[..., 1] << 8 | colors[..., 2] << 16 | colors[..., 3] << 24
+
+def _unpack(packed: numpy.ndarray) -> numpy.ndarray:
+    '''
+    The reverse of _pack, gives back a ... x 4 uint8 array.
+    '''
+    packed = numpy.asarray(packed, dtype = numpy.uint32)
+    return numpy.stack([(packed >> shift) & 0xFF for shift in (0, 8, 16, 24)],
+                       axis = -1).astype(numpy.uint8)
+
+def _distance_no_sqrt(c1: numpy.ndarray, c2: numpy.ndarray) -> numpy.ndarray:
+    '''
+    Color.distance_no_sqrt over (broadcastable) arrays of colors.
+    '''
+    return (c1[..., 3]-c2[..., 3])**2+(c1[..., 1]-c2[..., 1])**2+(c1[..., 2]-c2[..., 2])**2
+
+def _every_old_color() -> numpy.ndarray:
+    '''
+    Returns every old color (32 x 64 x 32 of them) as a flat array of RGBA values.
+    '''
+    r, g, b = numpy.meshgrid(numpy.arange(32), numpy.arange(64), numpy.arange(32), indexing = 'ij')
+    return numpy.stack([r.ravel(), g.ravel(), b.ravel(), numpy.full(r.size, 255)], axis = -1)
+
+def _open_raw(path: str) -> numpy.memmap:
+    '''
+    Memory maps the pixels of a raw image file (see Image.save_raw) as a
+    read only height x width x 4 array, so nothing is read until it's used.
+    '''
+    with open(path, 'rb') as file:
+        magic, width, height = _RAW_HEADER.unpack(file.read(_RAW_HEADER.size))
+    if magic != _RAW_MAGIC:
+        raise ValueError(f'{path} is not a raw image')
+    if width*height == 0:
+        return numpy.zeros((height, width, 4), dtype = numpy.uint8)
+    return numpy.memmap(path, dtype = numpy.uint8, mode = 'r', offset = _RAW_HEADER.size,
+                        shape = (height, width, 4))
 
 
 class Image:
     '''
-    This is merely a 2d array/map of Color objects.
+    This is merely a 2d array/map of colors. The pixels are kept in one
+    height x width x 4 (RGBA) numpy array of uint8s, and Color objects are
+    only made when asked for (colors() and indexing).
     '''
     def __init__(self, colors: [[Color]] = None, 
-                 width: int = None, height: int = None):
-        self._colors = colors
-        if colors == None:
-            self._colors = [[Color(0,0,0,0) for i in range(width)] for i in range(height)]
-        self._rect = rectangles.Rectangle(width = len(self._colors[0]), height = len(self._colors))
+                 width: int = None, height: int = None,
+                 pixels: numpy.ndarray = None):
+        '''
+        Make an Image from a 2d list of Colors, a blank (0,0,0,0) one of a
+        given width and height, or straight from a height x width x 4 array
+        of pixels (which is used as is, not copied).
+        '''
+        if pixels is None:
+            if colors == None:
+                pixels = numpy.zeros((height, width, 4), dtype = numpy.uint8)
+            else:
+                pixels = numpy.array([[c.to_tuple() for c in row] for row in colors],
+                                     dtype = numpy.uint8)
+                pixels = pixels.reshape(len(colors), len(colors[0]) if len(colors) else 0, 4)
+        self._pixels = pixels
+        self._rect = rectangles.Rectangle(width = self.width(), height = self.height())
+        self._mipmaps = None
 
     @staticmethod
-    def load(path: str, the_type: str = PIL) -> 'Image':
+    def load(path: str, the_type: str = PIL, stats: dict = None) -> 'Image':
         '''
         Takes a path leading to an image and turns it into an Image object.
-        There is realisically no difference between types. Also, since this
-        is really only done once, it doesn't matter that much.
+        There is realisically no difference between types. Either way the
+        library turns whatever mode the file is in (palette, grayscale, RGB,
+        with or without alpha) into RGBA all at once, and the image just uses
+        the bytes it hands back, without copying them again.
+        With RAW, the file (see save_raw) is memory mapped instead, so it opens
+        right away no matter how big it is, and only the parts of it that get
+        used (like the rows a transform samples) are ever read in.
+        Either way the pixels are read only. Anything that changes the image
+        (palette_swap, transform_onto, setting a row's Colors) gives it its own
+        copy first.
+        Stats, if given a dict, gets how long it took added to it (see add_hook).
         '''
-        if _DEBUG:
-            start = time.perf_counter()
-
-        colors = []
+        call_stats, start = _start(stats)
 
-        if the_type == PIL:
+        if the_type == RAW:
+            pixels = _open_raw(path)
+        elif the_type == PIL:
             image = Img.open(path)
-            pixels = image.load()
-            for y in range(image.height):
-                colors.append([])
-                for x in range(image.width):
-                    pixel = pixels[x,y]
-                    colors[y].append(Color(pixel[0],pixel[1],pixel[2],pixel[3] if len(pixel) == 4 else 255))
+            if image.mode != 'RGBA':
+                image = image.convert('RGBA')
+            pixels = numpy.asarray(image)
         elif the_type == PYGAME:
             image = pygame.image.load(path)
-            for y in range(image.get_height()):
-                colors.append([])
-                for x in range(image.get_width()):
-                    color = image.get_at((x,y))
-                    colors[y].append(Color(color.r, color.g, color.b, color.a))
+            pixels = numpy.frombuffer(pygame.image.tobytes(image, 'RGBA'), dtype = numpy.uint8)
+            pixels = pixels.reshape(image.get_height(), image.get_width(), 4)
+        else:
+            raise ValueError(f'Unknown type {the_type}')
 
-        if _DEBUG:
-            end = time.perf_counter()
-            print(f'Finished loading {path} via {the_type} in {end-start:.4f} seconds.')
-        return Image(colors)
+        _count(call_stats, 'pixels', pixels.shape[0]*pixels.shape[1])
+        _end('load', call_stats, stats, start)
+        return Image(pixels = pixels)
 
-    def convert(self, the_type: str = PYGAME) -> 'Image of a given type':
+    def convert(self, the_type: str = PYGAME, stats: dict = None) -> 'Image of a given type':
         '''
         Converts the current Image to an image from a
-        specific library.
+        specific library. Nothing gets copied, the image made uses this
+        Image's pixels as its own buffer, so changing these pixels shows in
+        it. For pygame, convert_alpha() it (once there's a display) for the
+        fastest blits, which makes a copy in the display's format.
         '''
-        if _DEBUG:
-            start = time.perf_counter()
+        call_stats, start = _start(stats)
 
-        image = None
+        if not self._pixels.flags.c_contiguous:
+            self._pixels = numpy.ascontiguousarray(self._pixels)
 
         if the_type == PIL:
-            colors = numpy.zeros((len(self._colors), len(self._colors[0]), 4), dtype = numpy.uint8)
-            for i in range(len(self._colors)):
-                for j in range(len(self._colors[i])):
-                    colors[i,j] = self._colors[i][j].to_tuple()
-            if _DEBUG:
-                print('Finished numpy array')
-            image = Img.fromarray(colors, 'RGBA')
+            image = Img.frombuffer('RGBA', (self.width(), self.height()), self._pixels,
+                                   'raw', 'RGBA', 0, 1)
         elif the_type == PYGAME:
-            image = pygame.Surface((self.width(),self.height())).convert_alpha()
-            for x in range(self.width()):
-                for y in range(self.height()):
-                    image.set_at((x,y), self._colors[y][x].to_tuple())
-
-        if _DEBUG:
-            end = time.perf_counter()
-            print(f'Finished converting with {the_type} in {end-start:.4f} seconds')
+            image = pygame.image.frombuffer(self._pixels, (self.width(), self.height()), 'RGBA')
+        else:
+            raise ValueError(f'Unknown type {the_type}')
+
+        _end('convert', call_stats, stats, start)
         return image
 
+    def save_raw(self, path: str) -> None:
+        '''
+        Saves the image as a raw image file: a small header (see _RAW_HEADER)
+        and then every pixel as RGBA bytes, row by row. Which is big, but can
+        be loaded (the_type = RAW) without reading any of it.
+        '''
+        with open(path, 'wb') as file:
+            file.write(_RAW_HEADER.pack(_RAW_MAGIC, self.width(), self.height()))
+            file.write(numpy.ascontiguousarray(self._pixels).data)
+
+    @staticmethod
+    def export_raw(source: str, path: str, band_height: int = 256) -> (int, int):
+        '''
+        Turns any image PIL can open into a raw image file (see save_raw),
+        band_height rows at a time, so only the decoded image (and not a
+        second RGBA copy of it) ever needs to be in memory. Returns the width
+        and height.
+        '''
+        image = Img.open(source)
+        width, height = image.size
+        with open(path, 'wb') as file:
+            file.write(_RAW_HEADER.pack(_RAW_MAGIC, width, height))
+            for y in range(0, height, band_height):
+                band = image.crop((0, y, width, min(y+band_height, height)))
+                file.write(band.convert('RGBA').tobytes())
+        return width, height
+
     def colors(self) -> [[Color]]:
         '''
         Returns all the colors in the image. :)
+        These are made fresh from the pixels, so changing them does
+        not change the image (use pixels() for that).
         '''
-        return self._colors
+        return [[Color.trusted(*p) for p in row] for row in self._pixels.tolist()]
+
+    def pixels(self) -> numpy.ndarray:
+        '''
+        Returns the height x width x 4 (RGBA) uint8 array backing the image.
+        This is not a copy, and is read only for loaded images (see load).
+        '''
+        return self._pixels
 
     def width(self) -> int:
         '''
         Returns the width of the image.
         '''
-        return len(self._colors[0])
+        return self._pixels.shape[1]
 
     def height(self) -> int:
         '''
         Returns the height of the image.
         '''
-        return len(self._colors)
+        return self._pixels.shape[0]
+
+    def mipmaps(self) -> (numpy.ndarray, ((int, int, int),)):
+        '''
+        Returns this image's mipmap pyramid, every level half the size of the one
+        before, packed into one array along with each level's (width, height, offset)
+        in it. It's only made the first time it's asked for, then kept with the image
+        (palette_swap throws it out, as should anything else changing the pixels).
+        '''
+        if self._mipmaps == None:
+            self._mipmaps = _pyramid(self._pixels)
+        return self._mipmaps
+
+    def clear_mipmaps(self) -> None:
+        '''
+        Throws out the kept mipmap pyramid, for after changing pixels() in place.
+        '''
+        self._mipmaps = None
 
     def transform(self, points: [(float, float)] = None,
                   rect: rectangles.Rectangle = None,
                   view: rectangles.Rectangle = None,
-                  alias_amount: float = 4, stripped: bool = True) -> 'Image':
+                  alias_amount: float = 4, stripped: bool = True,
+                  mode: str = rectangles.QUAD,
+                  workers: int = None, pool: str = THREADS,
+                  adaptive: float = None, stats: dict = None,
+                  filter: str = NEAREST, mipmap: bool = False,
+                  mesh: float = None) -> 'Image':
         '''
         Transforms the current image onto a rectangle. Okay, actually its a quadrilateral, but
         I'm not changing everything now.
@@ -347,14 +743,349 @@ class Image:
         2D coordinates as the points of the polygon to translate this image to. Also, the coordinates, from left to right in the iterable,
         represent the top left, top right, bottom right, and bottom left vertices of the image.
         If you instead use rect, that is just a valid rectangles.Rectangle.
-        The view is optional, and will crop the resulting image to those coordinates.
+        The view is optional, and will crop the resulting image to those coordinates, so the result is the size of the view and only
+        the view gets worked out.
         The alias_amount is like a clarity, as you increase it gets clearer, but takes longer (of factor O(n^2)). Centered around 1, so 0-1 makes
-        the image look worse, but 1+ makes it look better, especially as size increases.
+        the image look worse, but 1+ makes it look better, especially as size increases. Each pixel is the average of an alias_amount by
+        alias_amount grid of samples, where samples outside the image count as blank (0,0,0,0) filler. Under 1, one sample is stretched
+        over every 1/alias_amount pixels.
         Stripped takes effect with a view, and will offset the image so the top left corner is 0,0, so it removes the blank color entries.
-        Also, know that this is slow.
+        Mode is the rectangles mapping to use, rectangles.QUAD (the default) or rectangles.PROJECTIVE for a perspective warp.
+        Workers splits the work into tiles done over that many THREADS or PROCESSES (pool). Threads are cheap to start and fine
+        since numpy lets go of the GIL, processes share the image and result through shared memory instead of copying them.
+        Adaptive (a number) only fully anti-aliases the pixels that need it. Pixels wholly in the rectangle are the average of
+        samples at their corners (about two samples a pixel, since neighbours share corners, plus one at the middle), unless
+        those differ by more than adaptive in any channel, in which case, like pixels on the rectangle's edges, they get every
+        sample. That's a contrast check, not an error bound: almost every pixel ends up within a few of the full thing, for a
+        lot fewer samples, but detail thin enough to miss all five samples of a pixel is missed (worst with NEAREST).
+        Stats, if given a dict, gets what the transform did added to it (see add_hook for what all is counted).
+        Filter is how each sample reads the image, NEAREST (the default) just takes the pixel it lands in, BILINEAR
+        and BICUBIC blend the pixels around it, which is a lot smoother for the same alias_amount (so alias_amount 1
+        with BILINEAR looks about as good as 4 without, especially scaling up, for way fewer samples).
+        Mipmap reads every pixel from the levels of the image's mipmap pyramid (see mipmaps) that fit how much that
+        pixel shrinks the image, blending between the two closest. So shrinking things down doesn't need a big
+        alias_amount to not look noisy, and costs the same per pixel no matter how much smaller it gets. Best with
+        BILINEAR, and can't be used with adaptive.
+        Mesh (a number) only works the mapping out exactly every rectangles.MESH_CELL pixels and bilinearly
+        interpolates between, splitting up the squares where that's more than mesh (source) pixels off (checked on a
+        finer grid of points with room to spare, see rectangles.MeshMapping). The QUAD mapping is slow enough that this
+        makes big transforms a good bit faster, and mesh = .25 or so can't really be seen. PROJECTIVE is cheap
+        anyway, so it doesn't help there.
+        Where the samples land is cached (see set_sample_cache_size), so doing the same transform again, even on another image
+        of the same size, skips working any of that out.
+        '''
+        call_stats, start = _start(stats)
+        clock = _clock(call_stats)
+        mapping, (x, y, width, height), window = self._transform_setup(points, rect, view, stripped, mode, mesh)
+        left, top, w, h = window
+        _count(call_stats, 'pixels', width*height)
+        _count(call_stats, 'blank_pixels', width*height - w*h)
+        clock = _lap(call_stats, 'geometry_seconds', clock)
+
+        rendered = self._render(mapping, window, workers, pool, call_stats,
+                                alias_amount = alias_amount, adaptive = adaptive,
+                                filter = filter, mipmap = mipmap)
+        clock = _clock(call_stats)
+        new_pixels = numpy.zeros((height, width, 4), dtype = numpy.uint8)
+        new_pixels[top-y:top-y+h, left-x:left-x+w] = rendered
+        new_image = Image(pixels = new_pixels)
+        _lap(call_stats, 'output_seconds', clock)
+
+        _end('transform', call_stats, stats, start)
+        return new_image
+
+    def transform_onto(self, dest: 'Image', points: [(float, float)] = None,
+                       rect: rectangles.Rectangle = None,
+                       view: rectangles.Rectangle = None,
+                       alias_amount: float = 4, mode: str = rectangles.QUAD,
+                       workers: int = None, pool: str = THREADS,
+                       adaptive: float = None, stats: dict = None,
+                       filter: str = NEAREST, mipmap: bool = False,
+                       mesh: float = None) -> (int, int, int, int):
+        '''
+        Same as transform, but draws the result straight onto dest (another Image, which
+        gets changed) instead of making a new one. The points (or rect) are where it goes
+        in dest, so it's never stripped, and only the part of it in dest (and in view, if
+        given) is worked out. That is blended over what's already there by its alpha, and
+        nothing outside the rectangle (or blank in it) gets touched, so there isn't a
+        bounding box of filler to make and then paste. Returns the window (left, top,
+        width, height) of dest that was drawn over.
+        '''
+        call_stats, start = _start(stats)
+        clock = _clock(call_stats)
+        if view == None:
+            view = rectangles.Rectangle(width = dest.width(), height = dest.height())
+        mapping, _, (left, top, w, h) = self._transform_setup(points, rect, view, False, mode, mesh)
+        w = max(0, min(w, dest.width()-left))
+        h = max(0, min(h, dest.height()-top))
+        _count(call_stats, 'pixels', w*h)
+        clock = _lap(call_stats, 'geometry_seconds', clock)
+
+        if w > 0 and h > 0:
+            rendered = self._render(mapping, (left, top, w, h), workers, pool, call_stats,
+                                    alias_amount = alias_amount, adaptive = adaptive,
+                                    filter = filter, mipmap = mipmap)
+            clock = _clock(call_stats)
+            if not dest._pixels.flags.writeable:
+                dest._pixels = numpy.array(dest._pixels)
+            _blend_over(dest._pixels[top:top+h, left:left+w], rendered)
+            dest._mipmaps = None
+            _lap(call_stats, 'output_seconds', clock)
+
+        _end('transform_onto', call_stats, stats, start)
+        return left, top, w, h
+
+    def transform_bands(self, points: [(float, float)] = None,
+                        rect: rectangles.Rectangle = None,
+                        view: rectangles.Rectangle = None,
+                        alias_amount: float = 4, stripped: bool = True,
+                        mode: str = rectangles.QUAD,
+                        workers: int = None, pool: str = THREADS,
+                        adaptive: float = None, stats: dict = None,
+                        band_height: int = 64, filter: str = NEAREST,
+                        mipmap: bool = False, mesh: float = None) -> 'generator of (int, Image)':
+        '''
+        Same as transform, but instead of making the whole result at once, yields it
+        from top to bottom as (top row, Image) pairs of band_height rows each. So only
+        one band (plus this image) needs to be in memory at a time. The stats (and
+        hooks) only get told about it once every band has been gone through. With
+        PROCESSES, the workers and the source they share are set up once for every
+        band, and kept until the last one (or until the generator is closed).
+        '''
+        call_stats, call_start = _start(stats)
+        clock = _clock(call_stats)
+        mapping, (x, y, width, height), (left, top, w, h) = self._transform_setup(points, rect, view, stripped, mode, mesh)
+        _count(call_stats, 'pixels', width*height)
+        _count(call_stats, 'blank_pixels', width*height - w*h)
+        _lap(call_stats, 'geometry_seconds', clock)
+        with contextlib.ExitStack() as stack:
+            if workers != None and pool == PROCESSES and w > 0 and h > 0:
+                pixels = self.mipmaps()[0] if mipmap else self._pixels
+                pool = stack.enter_context(_SharedTiles(pixels, workers,
+                                                        pixels.shape[:-3] + (min(band_height, h), w, 4)))
+            for row in range(0, height, band_height):
+                rows = min(band_height, height-row)
+                band = numpy.zeros((rows, width, 4), dtype = numpy.uint8)
+                start = max(y+row, top)
+                end = min(y+row+rows, top+h)
+                if end > start:
+                    band[start-y-row:end-y-row, left-x:left-x+w] = self._render(mapping, (left, start, w, end-start),
+                                                                                workers, pool, call_stats,
+                                                                                alias_amount = alias_amount,
+                                                                                adaptive = adaptive,
+                                                                                filter = filter,
+                                                                                mipmap = mipmap)
+                yield row, Image(pixels = band)
+        _end('transform_bands', call_stats, stats, call_start)
+
+    def transform_to_file(self, file: 'binary file', points: [(float, float)] = None,
+                          rect: rectangles.Rectangle = None,
+                          view: rectangles.Rectangle = None,
+                          alias_amount: float = 4, stripped: bool = True,
+                          mode: str = rectangles.QUAD,
+                          workers: int = None, pool: str = THREADS,
+                          adaptive: float = None, stats: dict = None,
+                          band_height: int = 64, filter: str = NEAREST,
+                          mipmap: bool = False, mesh: float = None) -> (int, int):
+        '''
+        Streams a transform (see transform_bands) into an open binary file as raw
+        RGBA bytes, row by row. Returns the width and height of what was written.
+        '''
+        call_stats, start = _start(stats)
+        width = 0
+        height = 0
+        for y, band in self.transform_bands(points = points, rect = rect, view = view,
+                                            alias_amount = alias_amount, stripped = stripped,
+                                            mode = mode, workers = workers, pool = pool,
+                                            adaptive = adaptive, stats = call_stats,
+                                            band_height = band_height, filter = filter,
+                                            mipmap = mipmap, mesh = mesh):
+            clock = _clock(call_stats)
+            file.write(band._pixels.tobytes())
+            width = band.width()
+            height = y+band.height()
+            _lap(call_stats, 'output_seconds', clock)
+        _end('transform_to_file', call_stats, stats, start)
+        return width, height
+
+    def transform_to_raw(self, path: str, points: [(float, float)] = None,
+                         rect: rectangles.Rectangle = None,
+                         view: rectangles.Rectangle = None,
+                         alias_amount: float = 4, stripped: bool = True,
+                         mode: str = rectangles.QUAD,
+                         workers: int = None, pool: str = THREADS,
+                         adaptive: float = None, stats: dict = None,
+                         band_height: int = 64, filter: str = NEAREST,
+                         mipmap: bool = False, mesh: float = None) -> (int, int):
+        '''
+        Same as transform_to_file, but into a raw image file (see save_raw),
+        so the result can be loaded back (the_type = RAW) without reading it.
+        '''
+        with open(path, 'wb') as file:
+            file.write(_RAW_HEADER.pack(_RAW_MAGIC, 0, 0))
+            width, height = self.transform_to_file(file, points = points, rect = rect, view = view,
+                                                   alias_amount = alias_amount, stripped = stripped,
+                                                   mode = mode, workers = workers, pool = pool,
+                                                   adaptive = adaptive, stats = stats,
+                                                   band_height = band_height, filter = filter,
+                                                   mipmap = mipmap, mesh = mesh)
+            file.seek(0)
+            file.write(_RAW_HEADER.pack(_RAW_MAGIC, width, height))
+        return width, height
+
+    @staticmethod
+    def transform_batch(images: ['Image'] or numpy.ndarray, points: [(float, float)] = None,
+                        rect: rectangles.Rectangle = None,
+                        view: rectangles.Rectangle = None,
+                        alias_amount: float = 4, stripped: bool = True,
+                        mode: str = rectangles.QUAD,
+                        workers: int = None, pool: str = THREADS,
+                        stats: dict = None, filter: str = NEAREST,
+                        mipmap: bool = False, mesh: float = None) -> ['Image'] or numpy.ndarray:
+        '''
+        Same as transform, but for many images of the same size (like the frames of an
+        animation) all going onto the same rectangle. The mapping is worked out once
+        and every image is looked up at once. Images can be a list of Images, which
+        gives back a list of Images, or an N x height x width x 4 uint8 array (a stack
+        of frames), which gives back the same for the results. With mipmap, the
+        pyramid of every frame gets made just for this (it isn't kept).
+        '''
+        call_stats, start = _start(stats)
+        clock = _clock(call_stats)
+        frames = images if isinstance(images, numpy.ndarray) else \
+                 numpy.stack([i._pixels for i in images])
+        mapping, (x, y, width, height), window = \
+            Image(pixels = frames[0])._transform_setup(points, rect, view, stripped, mode, mesh)
+        left, top, w, h = window
+        _count(call_stats, 'pixels', len(frames)*width*height)
+        _count(call_stats, 'blank_pixels', len(frames)*(width*height - w*h))
+
+        levels = None
+        if mipmap:
+            frames, levels = _pyramid(frames)
+        _lap(call_stats, 'geometry_seconds', clock)
+        if workers == None:
+            rendered = _render_window(frames, mapping, *window, alias_amount = alias_amount,
+                                      filter = filter, levels = levels, stats = call_stats)
+        else:
+            rendered = _render_tiles(frames, mapping, *window, workers, pool, call_stats,
+                                     alias_amount = alias_amount, filter = filter, levels = levels)
+        clock = _clock(call_stats)
+        new_frames = numpy.zeros((len(frames), height, width, 4), dtype = numpy.uint8)
+        new_frames[:, top-y:top-y+h, left-x:left-x+w] = rendered
+        if not isinstance(images, numpy.ndarray):
+            new_frames = [Image(pixels = frame) for frame in new_frames]
+        _lap(call_stats, 'output_seconds', clock)
+
+        _end('transform_batch', call_stats, stats, start)
+        return new_frames
+
+    @staticmethod
+    def render_scene(sprites: [('Image', [(float, float)] or rectangles.Rectangle)],
+                     width: int = None, height: int = None, dest: 'Image' = None,
+                     alias_amount: float = 4, mode: str = rectangles.QUAD,
+                     workers: int = None, adaptive: float = None, stats: dict = None,
+                     filter: str = NEAREST, mipmap: bool = False, mesh: float = None,
+                     tile_size: int = None) -> 'Image':
+        '''
+        Draws a whole scene of sprites, (Image, points or rect) pairs, in order (so later ones
+        go on top) onto dest, or a new blank width by height Image, which is returned. Same
+        as transform_onto for each one, but the sprites are rendered front to back first, so
+        nothing is worked out for the bits of one that are behind solid bits of the ones in
+        front of it (which would be drawn right over them), and then drawn. With workers,
+        the canvas is split into tile_size squares, each sprite only put in the tiles its
+        bounds cover, and workers threads each take some tiles (they don't overlap, so they
+        never draw over each other; there's no PROCESSES, since every sprite would need
+        sharing). Otherwise it's all one tile, so every sprite is drawn in one go.
+        '''
+        call_stats, start = _start(stats)
+        clock = _clock(call_stats)
+        if dest == None:
+            dest = Image(pixels = numpy.zeros((height, width, 4), dtype = numpy.uint8))
+        elif not dest._pixels.flags.writeable:
+            dest._pixels = numpy.array(dest._pixels)
+        if workers == None:
+            size = max(dest.width(), dest.height())
+        else:
+            size = tile_size or _SCENE_TILE_SIZE
+        view = rectangles.Rectangle(width = dest.width(), height = dest.height())
+
+        #Every sprite that shows up, and which of them (in order) are in each tile
+        placed = []
+        tiles = {}
+        for image, quad in sprites:
+            rect = quad if isinstance(quad, rectangles.Rectangle) else None
+            mapping, _, (left, top, w, h) = image._transform_setup(quad, rect, view, False, mode, mesh)
+            w = min(w, dest.width()-left)
+            h = min(h, dest.height()-top)
+            if w <= 0 or h <= 0:
+                continue
+            pixels, levels = image.mipmaps() if mipmap else (image._pixels, None)
+            for tile_y in range(top//size, (top+h-1)//size+1):
+                for tile_x in range(left//size, (left+w-1)//size+1):
+                    tiles.setdefault((tile_x, tile_y), []).append(len(placed))
+            placed.append((pixels, levels, mapping, left, top, w, h))
+            _count(call_stats, 'pixels', w*h)
+        _lap(call_stats, 'geometry_seconds', clock)
+
+        def render(tile):
+            (tile_x, tile_y), indices = tile
+            tile_stats = {}
+            tile_left = tile_x*size
+            tile_top = tile_y*size
+            tile_right = min(tile_left+size, dest.width())
+            tile_bottom = min(tile_top+size, dest.height())
+            #Which pixels something already drawn in front of them covers solidly
+            covered = numpy.zeros((tile_bottom-tile_top, tile_right-tile_left), dtype = bool)
+            drawn = []
+            for index in reversed(indices):
+                pixels, levels, mapping, left, top, w, h = placed[index]
+                x = max(left, tile_left)
+                y = max(top, tile_top)
+                right = min(left+w, tile_right)
+                bottom = min(top+h, tile_bottom)
+                #Only the part of the window that isn't all hidden needs rendering
+                shown = ~covered[y-tile_top:bottom-tile_top, x-tile_left:right-tile_left]
+                rows = numpy.flatnonzero(shown.any(axis = 1))
+                if len(rows) == 0:
+                    continue
+                columns = numpy.flatnonzero(shown.any(axis = 0))
+                x, right = x+int(columns[0]), x+int(columns[-1])+1
+                y, bottom = y+int(rows[0]), y+int(rows[-1])+1
+                hidden = covered[y-tile_top:bottom-tile_top, x-tile_left:right-tile_left]
+                rendered = _render_window(pixels, mapping, x, y, right-x, bottom-y, alias_amount,
+                                          adaptive, filter, levels, tile_stats, False, hidden)
+                hidden |= rendered[..., 3] == 255
+                drawn.append((rendered, numpy.s_[y:bottom, x:right]))
+
+            clock = _clock(tile_stats)
+            for rendered, window in reversed(drawn):
+                _blend_over(dest._pixels[window], rendered)
+            _lap(tile_stats, 'output_seconds', clock)
+            return tile_stats
+
+        if workers == None:
+            all_stats = [render(tile) for tile in tiles.items()]
+        else:
+            with futures.ThreadPoolExecutor(workers) as executor:
+                all_stats = list(executor.map(render, tiles.items()))
+        for tile_stats in all_stats:
+            for name, amount in tile_stats.items():
+                _count(call_stats, name, amount)
+        dest._mipmaps = None
+
+        _end('render_scene', call_stats, stats, start)
+        return dest
+
+    def _transform_setup(self, points: [(float, float)], rect: rectangles.Rectangle,
+                         view: rectangles.Rectangle, stripped: bool, mode: str,
+                         mesh: float = None) -> (rectangles.QuadMapping, (int, int, int, int), (int, int, int, int)):
+        '''
+        Works out the geometry of a transform. Returns the mapping from the result
+        onto this image (approximated by a rectangles.MeshMapping if mesh), the area
+        (left, top, width, height) the result covers, and the window (also left, top,
+        width, height) in it which isn't just left blank.
         '''
-        if _DEBUG:
-            start = time.perf_counter()
         r = rect
         if r == None:
             if len(points) != 4:
@@ -376,97 +1107,76 @@ class Image:
             max_y = r.max_y()
             min_y = r.min_y()
 
-        topleft = (min_x,min_y)
-        botright = (max_x,max_y)
-
-        if view != None:
-            topleft = (view.min_x(),view.min_y())
-            botleft = (view.max_x(),view.max_y())
-
-        new_image_colors = []
-        increment_amount = 1/alias_amount
-        cur_y = 0
-        for y in range(int(max_y)):
-            cur_x = 0
-            new_image_colors.append([])
-            the_y = cur_y
-            for x in range(int(max_x)):
-                if not (topleft[0] <= x <= botright[0] and \
-                        topleft[1] <= y <= botright[1]):
-                    cur_x = x
-                    new_image_colors[-1].append(Color(0,0,0,0))
-                    continue
-
-                colors = []
-                blanks = 0
-
-                the_y = cur_y
-                the_x = cur_x
-                while the_y < y+1:
-                    the_x = cur_x
-                    while the_x < x+1:
-                        image_point = r.transform(
-                            rectangles.Coordinate(cur_x,
-                                                  cur_y),
-                            self._rect)
-                        if image_point != None and \
-                           0 <= image_point.x < self.width() and \
-                           0 <= image_point.y < self.height():
-                            colors.append(self._colors[int(image_point.y)][int(image_point.x)])
-                        else:
-                            blanks += 1
-                        the_x += increment_amount
-                    the_y += increment_amount
-                cur_x = the_x
-
-                if blanks == 0 and len(colors) == 0:
-                    temp_x = x
-                    temp_y = y
-                    if cur_y > y:
-                        temp_y = int(the_y - increment_amount)
-                    if cur_x > x:
-                        temp_x = int(the_x - increment_amount)
-                    colors.append(new_image_colors[temp_y][temp_x])
-                
-                new_image_colors[-1].append(Color.average_list(colors, blanks))
-            cur_y = the_y
-
-        new_image = Image(new_image_colors)
+        mapping = r.mapping(self._rect, mode)
+        if mesh != None:
+            mapping = rectangles.MeshMapping(mapping, max_error = mesh)
 
         if stripped:
             r.move(movement_strip)
 
-        if _DEBUG:
-            end = time.perf_counter()
-            print(f'Finished transform in {end-start:.4f} seconds')
-        return new_image
-
-    def scale_to_dimension(self, x: int, y: int, alias_amount = 1) -> 'Image':
+        area = (0, 0, int(max_x), int(max_y))
+        if view != None:
+            left = math.ceil(view.min_x())
+            top = math.ceil(view.min_y())
+            area = (left, top, max(0, math.ceil(view.max_x())-left), max(0, math.ceil(view.max_y())-top))
+
+        #Only the part of the area in the rectangle's bounds has anything in it
+        left = max(area[0], math.floor(min_x), 0)
+        top = max(area[1], math.floor(min_y), 0)
+        right = min(area[0]+area[2], int(max_x))
+        bottom = min(area[1]+area[3], int(max_y))
+        return mapping, area, (left, top, max(0, right-left), max(0, bottom-top))
+
+    def _render(self, mapping: rectangles.QuadMapping, window: (int, int, int, int),
+                workers: int = None, pool: str = THREADS, stats: dict = None,
+                mipmap: bool = False, **options) -> numpy.ndarray:
+        '''
+        Renders a window (left, top, width, height) of a transform through mapping,
+        over workers if given, from this image's mipmaps if mipmap. Options are
+        passed along to _render_window.
+        '''
+        pixels = self._pixels
+        levels = None
+        if mipmap:
+            pixels, levels = self.mipmaps()
+        if workers == None:
+            return _render_window(pixels, mapping, *window, levels = levels, stats = stats, **options)
+        return _render_tiles(pixels, mapping, *window, workers, pool, stats, levels = levels, **options)
+
+    def scale_to_dimension(self, x: int, y: int, alias_amount = 1, filter: str = NEAREST,
+                           mipmap: bool = False) -> 'Image':
         r = [(0,0),(x,0),(x,y),(0,y)]
-        return self.transform(r, alias_amount = alias_amount)
+        return self.transform(r, alias_amount = alias_amount, filter = filter, mipmap = mipmap)
 
-    def scale(self, scalar: float, alias_amount = 1) -> 'Image':
+    def scale(self, scalar: float, alias_amount = 1, filter: str = NEAREST,
+              mipmap: bool = False) -> 'Image':
         r = [(0,0),(self.width()*scalar,0),(self.width()*scalar,self.height()*scalar),(0,self.height()*scalar)]
-        return self.transform(r, alias_amount = alias_amount)
+        return self.transform(r, alias_amount = alias_amount, filter = filter, mipmap = mipmap)
 
-    def apply_palette(self, p: Palette) -> 'Image':
+    def apply_palette(self, p: Palette, stats: dict = None) -> 'Image':
         '''
         Like is stated in Palette, pretty much only used for old games with limited palettes.
         Will set every color in this Image to one in the palette p, by finding the closest color
         in the palette to the one being changed.
         '''
-        #for row in range(len(self._colors)):
-        #    for col in range(len(self._colors[row])):
-        #        self._colors[row][col] = p[self._colors[row][col]].to_new()
-        return Image([[p[self._colors[row][col]].to_new() for col in range(len(self._colors[row]))] for row in range(len(self._colors))])
+        call_stats, start = _start(stats)
+        new_image = Image(pixels = p.new_colors()[p.closest_indices(self._pixels)])
+        _count(call_stats, 'pixels', self.width()*self.height())
+        _end('apply_palette', call_stats, stats, start)
+        return new_image
 
-    def palette_swap(self, p1: 'current palette', p2: 'new palette'):
+    def palette_swap(self, p1: 'current palette', p2: 'new palette', stats: dict = None):
         '''
         Will change THIS Image.
         '''
-        for row in range(len(self._colors)):
-            for col in range(len(self._colors[row])):
-                self._colors[row][col] = p1.swap_color(self._colors[row][col], p2)
+        call_stats, start = _start(stats)
+        if self._pixels.flags.writeable:
+            self._pixels[:] = p1.swap_pixels(self._pixels, p2)
+        else:
+            self._pixels = p1.swap_pixels(self._pixels, p2)
+        self._mipmaps = None
+        _count(call_stats, 'pixels', self.width()*self.height())
+        _end('palette_swap', call_stats, stats, start)
 
     def add_right(self, i: 'Image') -> 'Image':
         '''
@@ -474,50 +1184,919 @@ class Image:
         So if you had image that looks like \o/, and add_right an image
         that looks like _._, you will get \o/_._
         '''
-        new = []
-        for row in range(max(self.height(), i.height())):
-            new.append([])
-            for col in range(self.width()):
-                new[row].append(self[row][col] if row < self.height() else Color(0,0,0,0))
-            for col in range(i.width()):
-                new[row].append(i[row][col] if row < i.height() else Color(0,0,0,0))
-        return Image(new)
+        return Image.mosaic([self, i], ROWS, columns = 2)[0]
 
     def add_down(self, i: 'Image') -> 'Image':
         '''
         Adds an image below this image and returns that.
         '''
-        new = []
-        for row in range(self.height()):
-            new.append([])
-            for col in range(max(self.width(), i.width())):
-                new[row].append(self[row][col] if col < self.width() else Color(0,0,0,0))
-        for row in range(i.height()):
-            new.append([])
-            for col in range(max(self.width(), i.width())):
-                new[-1].append(i[row][col] if col < i.width() else Color(0,0,0,0))
-        return Image(new)
+        return Image.mosaic([self, i], ROWS, columns = 1)[0]
+
+    @staticmethod
+    def mosaic(images: ['Image'], layout: str = GRID, columns: int = None,
+               width: int = None) -> ('Image', [(int, int, int, int)]):
+        '''
+        Puts many images together into one (like an atlas), working out where
+        everything goes first, so each image is only copied once. Returns the
+        mosaic and where each image ended up, as (left, top, width, height).
+        Layouts are:
+            GRID, a grid of columns (default about square) equally sized cells.
+            ROWS, rows of columns images each, packed left to right.
+            SHELF, shelves no wider than width (default about square) filled
+            tallest image first.
+        Anything not covered by an image is left blank.
+        '''
+        placements = [None]*len(images)
+        if layout == GRID:
+            columns = columns or max(1, math.ceil(len(images)**.5))
+            cell_width = max((i.width() for i in images), default = 0)
+            cell_height = max((i.height() for i in images), default = 0)
+            for index in range(len(images)):
+                row, col = divmod(index, columns)
+                placements[index] = (col*cell_width, row*cell_height,
+                                     images[index].width(), images[index].height())
+        elif layout == ROWS:
+            columns = columns or max(1, len(images))
+            top = 0
+            for start in range(0, len(images), columns):
+                left = 0
+                for index in range(start, min(start+columns, len(images))):
+                    placements[index] = (left, top, images[index].width(), images[index].height())
+                    left += images[index].width()
+                top += max(i.height() for i in images[start:start+columns])
+        elif layout == SHELF:
+            if width == None:
+                area = sum(i.width()*i.height() for i in images)
+                width = max(math.ceil(area**.5), max((i.width() for i in images), default = 0))
+            left = 0
+            top = 0
+            shelf_height = 0
+            for index in sorted(range(len(images)), key = lambda i: -images[i].height()):
+                if left + images[index].width() > width and left > 0:
+                    top += shelf_height
+                    left = 0
+                    shelf_height = 0
+                placements[index] = (left, top, images[index].width(), images[index].height())
+                left += images[index].width()
+                shelf_height = max(shelf_height, images[index].height())
+        else:
+            raise ValueError(f'Unknown layout {layout}')
+
+        new = numpy.zeros((max((y+h for x, y, w, h in placements), default = 0),
+                           max((x+w for x, y, w, h in placements), default = 0), 4),
+                          dtype = numpy.uint8)
+        for image, (x, y, w, h) in zip(images, placements):
+            new[y:y+h, x:x+w] = image._pixels
+        return Image(pixels = new), placements
     
-    def test_many_palettes(self, *p) -> 'Image':
+    def test_many_palettes(self, *p, stats: dict = None) -> 'Image':
         '''
         Will show palettes in order (from p) left to right, up to down.
+        Each different color in this image is only looked up once, in every
+        palette at the same time, and the whole sheet is made in one go.
         '''
         assert len(p) != 0
+        call_stats, start = _start(stats)
         cols = math.ceil(len(p)**.5)
         rows = math.ceil(len(p)/cols)
-        new_image = Image([[]])
-        for row in range(rows):
-            new_img2 = Image([[]])
-            for col in range(cols):
-                index = row*cols + col
-                if index >= len(p): break
-                i = self.apply_palette(p[index])
-                new_img2 = new_img2.add_right(i)
-            new_image = new_image.add_down(new_img2)
-        return new_image
+        keys, inverse = numpy.unique(_pack(self._pixels).ravel(), return_inverse = True)
+        colors = _unpack(keys)
+
+        mapped = numpy.zeros((rows*cols, len(keys), 4), dtype = numpy.uint8)
+        for index in range(len(p)):
+            mapped[index] = p[index].new_colors()[p[index].closest_indices(colors)]
+
+        sheet = mapped[:, inverse.ravel()].reshape(rows, cols, self.height(), self.width(), 4)
+        sheet = sheet.transpose(0, 2, 1, 3, 4).reshape(rows*self.height(), cols*self.width(), 4)
+        _count(call_stats, 'pixels', sheet.shape[0]*sheet.shape[1])
+        _end('test_many_palettes', call_stats, stats, start)
+        return Image(pixels = numpy.ascontiguousarray(sheet))
 
     def __getitem__(self, index):
-        return self._colors[index]
+        '''
+        Returns a row of the image (or a list of them, for a slice), which can be
+        indexed for its Colors and set to change the image, so img[y][x] = c works.
+        Like colors(), the Colors are made fresh, so changing one of them
+        (img[y][x].r = 0) does not change the image.
+        '''
+        if isinstance(index, slice):
+            return [_ImageRow(self, row) for row in range(self.height())[index]]
+        return _ImageRow(self, range(self.height())[index])
+
+
+class _ImageRow:
+    '''
+    A row of an Image (see Image.__getitem__), read and written as Colors.
+    '''
+    __slots__ = ('_image', '_row')
+
+    def __init__(self, image: Image, row: int):
+        self._image = image
+        self._row = row
+
+    def __len__(self):
+        return self._image.width()
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index) -> Color or [Color]:
+        pixels = self._image._pixels[self._row, index].tolist()
+        if isinstance(index, slice):
+            return [Color.trusted(*p) for p in pixels]
+        return Color.trusted(*pixels)
+
+    def __setitem__(self, index, c: Color or [Color]) -> None:
+        if isinstance(index, slice):
+            values = [color.to_new().to_tuple() for color in c]
+        else:
+            values = c.to_new().to_tuple()
+        if not self._image._pixels.flags.writeable:
+            self._image._pixels = numpy.array(self._image._pixels)
+        self._image._pixels[self._row, index] = values
+        self._image._mipmaps = None
+
+
+#Most samples to map at once, so big transforms don't need huge temporary arrays
+_CHUNK_SAMPLES = 1 << 20
+#Width and height of the tiles handed to each worker
+_TILE_SIZE = 128
+#Width and height of the tiles render_scene splits the canvas into for its
+#workers, bigger so that fewer sprites get split up
+_SCENE_TILE_SIZE = 256
+#Default most bytes of sample grids kept by the sample cache
+_SAMPLE_CACHE_BYTES = 64 << 20
+
+class _SampleCache:
+    '''
+    A least recently used cache of where the samples of a transform land in
+    the source (see _sample_indices), kept under max_bytes.
+    '''
+    def __init__(self, max_bytes: int):
+        self._grids = collections.OrderedDict()
+        self._bytes = 0
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def fits(self, size: int) -> bool:
+        '''
+        Returns whether something of size bytes could be kept at all.
+        '''
+        return size <= self._max_bytes
+
+    def get(self, key: tuple) -> numpy.ndarray:
+        '''
+        Returns what's kept for key (marking it as just used), or None.
+        '''
+        with self._lock:
+            grid = self._grids.get(key)
+            if grid is not None:
+                self._grids.move_to_end(key)
+            return grid
+
+    def put(self, key: tuple, grid: numpy.ndarray) -> None:
+        '''
+        Keeps grid for key, throwing out the least recently used grids
+        until it all fits.
+        '''
+        with self._lock:
+            if key in self._grids:
+                self._bytes -= self._grids.pop(key).nbytes
+            self._grids[key] = grid
+            self._bytes += grid.nbytes
+            self._shrink()
+
+    def resize(self, max_bytes: int) -> None:
+        '''
+        Changes how many bytes can be kept, throwing things out if needed.
+        '''
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._shrink()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._grids.clear()
+            self._bytes = 0
+
+    def _shrink(self) -> None:
+        while self._bytes > self._max_bytes and self._grids:
+            self._bytes -= self._grids.popitem(last = False)[1].nbytes
+
+_sample_cache = _SampleCache(_SAMPLE_CACHE_BYTES)
+
+def set_sample_cache_size(max_bytes: int) -> None:
+    '''
+    Sets how many bytes of transform sample grids are kept around, so that
+    repeating a transform (same rectangle, image size, alias_amount, view,
+    stripped and filter) skips all of the mapping. 0 turns it off.
+    '''
+    _sample_cache.resize(max_bytes)
+
+def clear_sample_cache() -> None:
+    '''
+    Throws out every kept sample grid.
+    '''
+    _sample_cache.clear()
+
+#Everything that wants to hear about each instrumented call
+_hooks = []
+
+class _CallStats(dict):
+    '''
+    The stats of one instrumented call. Calls made from inside of it (like
+    transform_to_file's transform_bands) just count into it too.
+    '''
+
+def add_hook(hook: 'function (name, stats)') -> None:
+    '''
+    Calls hook(name, stats) after every load, convert, transform (and its
+    bands, to_file and batch versions), apply_palette, palette_swap and
+    test_many_palettes, with the name of the method and a dict of what it did:
+        total_seconds       how long the whole call took
+        pixels              pixels made (or loaded, or swapped)
+    And for transforms, also:
+        geometry_seconds    working out the rectangle and which samples are in it
+        sampling_seconds    mapping the samples into the image
+        averaging_seconds   looking up and averaging (or filtering) the samples
+        output_seconds      putting the result together (or writing it out)
+        samples             samples mapped
+        outside_samples     samples outside the rectangle, left blank without mapping
+        missed_samples      samples mapped to nowhere on the image, so left blank
+        blank_pixels        pixels outside the rectangle (or view), never rendered
+        cache_hits          windows whose samples came from the sample cache
+    With workers, the times are added up over every worker. Without any hooks
+    (or stats passed in) none of this gets counted, so it costs nothing.
+    '''
+    _hooks.append(hook)
+
+def remove_hook(hook: 'function (name, stats)') -> None:
+    '''
+    Stops calling a hook added with add_hook.
+    '''
+    _hooks.remove(hook)
+
+@contextlib.contextmanager
+def collect() -> [(str, dict)]:
+    '''
+    A with block that gathers the (name, stats) of every call made in it
+    (see add_hook) into a list, as in:
+        with images.collect() as calls:
+            image.transform(...)
+    '''
+    calls = []
+    hook = lambda name, stats: calls.append((name, stats))
+    add_hook(hook)
+    try:
+        yield calls
+    finally:
+        remove_hook(hook)
+
+def print_stats(name: str, stats: dict) -> None:
+    '''
+    A hook (see add_hook) that just prints each call's stats.
+    '''
+    print(f'{name}: ' + ', '.join(f'{key} {value:.4f}' if isinstance(value, float) else f'{key} {value}'
+                                  for key, value in stats.items()))
+
+def _start(stats: dict) -> (dict, float):
+    '''
+    Starts instrumenting a call. Returns the stats it should count into (its
+    own, or None if nothing wants them) and when it started (None if it
+    doesn't need to be told about, see _end).
+    '''
+    if isinstance(stats, _CallStats):
+        return stats, None
+    if stats == None and not _hooks:
+        return None, None
+    return _CallStats(), time.perf_counter()
+
+def _end(name: str, call_stats: dict, stats: dict, start: float) -> None:
+    '''
+    Finishes instrumenting a call started with _start, adding what it
+    counted to stats and telling every hook about it.
+    '''
+    if start == None:
+        return
+    call_stats['total_seconds'] = time.perf_counter() - start
+    for key, amount in call_stats.items():
+        _count(stats, key, amount)
+    for hook in list(_hooks):
+        hook(name, dict(call_stats))
+
+def _clock(stats: dict) -> float:
+    '''
+    Returns the time now if there are stats to time things into (see _lap).
+    '''
+    if stats != None:
+        return time.perf_counter()
+
+def _lap(stats: dict, name: str, start: float) -> float:
+    '''
+    Adds the seconds since start (from _clock) to the timer name in stats,
+    if there are stats, and returns the time now so the next timer can start.
+    '''
+    if stats != None:
+        now = time.perf_counter()
+        stats[name] = stats.get(name, 0) + now - start
+        return now
+
+def _sample_offsets(alias_amount: float) -> numpy.ndarray:
+    '''
+    Returns where, from the top/left of a pixel, it gets sampled along one
+    axis for a given alias amount (just 0 when the alias amount is under 1).
+    '''
+    if alias_amount < 1:
+        return numpy.zeros(1)
+    return numpy.arange(math.ceil(alias_amount - 1e-9))/alias_amount
+
+def _sample_coords(start: int, length: int, alias_amount: float,
+                   centered: bool = False) -> numpy.ndarray:
+    '''
+    Returns a length x samples array of the coordinates sampled along one axis
+    for the pixels start through start+length. If centered, the samples are
+    in the middle of the bit of pixel they stand for instead of its top/left.
+    '''
+    coords = numpy.arange(start, start+length, dtype = float)
+    if alias_amount < 1:
+        coords = numpy.floor(coords*alias_amount)/alias_amount
+    if centered:
+        coords += .5/alias_amount
+    return coords[:, None] + _sample_offsets(alias_amount)[None, :]
+
+def _source_indices(shape: tuple, xs: numpy.ndarray, ys: numpy.ndarray,
+                    valid: numpy.ndarray) -> numpy.ndarray:
+    '''
+    Nearest neighbour, turns (mapped) coordinates xs, ys into flat indices of
+    pixels in a source of the given shape, with -1 for anything invalid or off it.
+    '''
+    with numpy.errstate(invalid = 'ignore'):
+        inside = valid & (xs >= 0) & (xs < shape[1]) & (ys >= 0) & (ys < shape[0])
+    indices = numpy.full(xs.shape, -1, dtype = numpy.int32 if shape[0]*shape[1] < 2**31 else numpy.int64)
+    indices[inside] = ys[inside].astype(numpy.intp)*shape[1] + xs[inside].astype(numpy.intp)
+    return indices
+
+def _gather_indices(pixels: numpy.ndarray, indices: numpy.ndarray) -> numpy.ndarray:
+    '''
+    Looks up the pixels at flat indices (see _source_indices), with -1 coming
+    back as (0,0,0,0). Pixels can be a stack of same sized images (... x height
+    x width x 4), in which case every one of them gets looked up.
+    '''
+    if pixels.shape[-3]*pixels.shape[-2] == 0:
+        return numpy.zeros(pixels.shape[:-3] + indices.shape + (4,), dtype = numpy.uint8)
+    found = indices >= 0
+    colors = pixels.reshape(pixels.shape[:-3] + (-1, 4))[..., numpy.where(found, indices, 0), :]
+    colors *= found[..., None]
+    return colors
+
+def _gather(pixels: numpy.ndarray, xs: numpy.ndarray, ys: numpy.ndarray,
+            valid: numpy.ndarray) -> numpy.ndarray:
+    '''
+    Nearest neighbour lookup of the pixels at the (mapped) coordinates xs, ys.
+    Anything invalid or off the image comes back as (0,0,0,0).
+    '''
+    return _gather_indices(pixels, _source_indices(pixels.shape[-3:-1], xs, ys, valid))
+
+def _filter_weights(fractions: numpy.ndarray, filter: str) -> [(int, numpy.ndarray)]:
+    '''
+    Returns (offset, weight) pairs for the neighbouring pixels a filter blends
+    along one axis, where fractions are how far past the pixel before it each
+    point is. Bicubic is Catmull-Rom (Keys with a = -0.5).
+    '''
+    t = fractions
+    if filter == NEAREST:
+        return [(0, numpy.ones_like(t))]
+    if filter == BILINEAR:
+        return [(0, 1-t), (1, t)]
+    if filter == BICUBIC:
+        return [(-1, ((-.5*t + 1)*t - .5)*t),
+                (0, (1.5*t - 2.5)*t*t + 1),
+                (1, ((-1.5*t + 2)*t + .5)*t),
+                (2, (.5*t - .5)*t*t)]
+    raise ValueError(f'Unknown filter {filter}')
+
+def _interpolate(pixels: numpy.ndarray, points: numpy.ndarray,
+                 filter: str, level: tuple = None) -> numpy.ndarray:
+    '''
+    Bilinear or bicubic (or nearest) lookup of pixels at points (... x 2 source
+    x, y, with pixel centers on whole numbers), with neighbours off the image
+    clamped to its edge. Points that are nan come back as (0,0,0,0). Returns
+    float32 colors, which can be a bit past 0-255 for bicubic.
+    If pixels is a packed pyramid (see _pyramid), level is the (widths, heights,
+    offsets) of the level each point is in, as arrays or single numbers.
+    '''
+    width, height, offset = level or (pixels.shape[-2], pixels.shape[-3], 0)
+    found = ~numpy.isnan(points[..., 0])
+    xs = numpy.where(found, points[..., 0], 0)
+    ys = numpy.where(found, points[..., 1], 0)
+    left = numpy.floor(xs + .5 if filter == NEAREST else xs)
+    top = numpy.floor(ys + .5 if filter == NEAREST else ys)
+    colors = numpy.zeros(pixels.shape[:-3] + points.shape[:-1] + (4,), dtype = numpy.float32)
+    for j, y_weight in _filter_weights((ys-top).astype(numpy.float32), filter):
+        rows = offset + numpy.clip(top+j, 0, height-1).astype(numpy.intp)*width
+        for i, x_weight in _filter_weights((xs-left).astype(numpy.float32), filter):
+            indices = numpy.where(found, rows + numpy.clip(left+i, 0, width-1).astype(numpy.intp), -1)
+            colors += _gather_indices(pixels, indices)*(x_weight*y_weight)[..., None]
+    return colors
+
+def _to_bytes(colors: numpy.ndarray) -> numpy.ndarray:
+    '''
+    Rounds float colors back into uint8 ones.
+    '''
+    return numpy.clip(numpy.rint(colors), 0, _BYTE).astype(numpy.uint8)
+
+def _pyramid(pixels: numpy.ndarray) -> (numpy.ndarray, ((int, int, int),)):
+    '''
+    Builds the mipmap pyramid of pixels (or of each of a stack of them): every
+    level is half the one before (rounded up, with the last row/column doubled
+    up when odd), each pixel the average of the 2x2 pixels it covers, down to
+    1x1. Returns every level packed one after another into a single ... x 1 x
+    pixels x 4 array, so it can be gathered from like one image (and shared
+    like one), along with the (width, height, offset) of each level in it.
+    '''
+    flat = []
+    levels = []
+    offset = 0
+    level = pixels
+    while True:
+        height, width = level.shape[-3:-1]
+        flat.append(level.reshape(level.shape[:-3] + (-1, 4)))
+        levels.append((width, height, offset))
+        offset += width*height
+        if width <= 1 and height <= 1:
+            break
+        if height % 2:
+            level = numpy.concatenate([level, level[..., -1:, :, :]], axis = -3)
+        if width % 2:
+            level = numpy.concatenate([level, level[..., -1:, :]], axis = -2)
+        level = ((level[..., 0::2, 0::2, :].astype(numpy.uint16) + level[..., 1::2, 0::2, :] +
+                  level[..., 0::2, 1::2, :] + level[..., 1::2, 1::2, :] + 2)//4).astype(numpy.uint8)
+    return numpy.concatenate(flat, axis = -2)[..., None, :, :], tuple(levels)
+
+def _mipmap_lods(mapping: rectangles.QuadMapping, left: int, top: int,
+                 width: int, height: int, alias_amount: float,
+                 levels: int) -> numpy.ndarray:
+    '''
+    Works out which pyramid level (as a fraction, for blending between two)
+    each pixel of a window should read from, by mapping the corners of every
+    pixel and seeing how far apart the source pixels its samples land on are.
+    Returns a height x width array from 0 to levels-1.
+    '''
+    corner_xs = numpy.arange(left, left+width+1, dtype = float)
+    corner_ys = numpy.arange(top, top+height+1, dtype = float)
+    mapped_xs, mapped_ys, _ = mapping.map_array(corner_xs[None, :], corner_ys[:, None],
+                                                contained = True)
+    with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+        across = numpy.hypot(numpy.diff(mapped_xs, axis = 1), numpy.diff(mapped_ys, axis = 1))
+        down = numpy.hypot(numpy.diff(mapped_xs, axis = 0), numpy.diff(mapped_ys, axis = 0))
+        size = numpy.fmax(numpy.fmax(across[:-1], across[1:]), numpy.fmax(down[:, :-1], down[:, 1:]))
+        lods = numpy.log2(size/alias_amount)
+    return numpy.clip(numpy.nan_to_num(lods, nan = 0), 0, levels-1)
+
+def _mipmap_average(pyramid: numpy.ndarray, levels: ((int, int, int),),
+                    points: numpy.ndarray, lods: numpy.ndarray,
+                    filter: str) -> numpy.ndarray:
+    '''
+    Same as _average_points, but each sample is read from the pyramid levels
+    on either side of its pixel's level (see _mipmap_lods) and blended between
+    them (trilinear, with BILINEAR).
+    '''
+    samples = points.shape[1]
+    base_width, base_height, _ = levels[0]
+    table = numpy.array(levels)
+    low = numpy.floor(lods).astype(numpy.intp)
+    blend = (lods-low).astype(numpy.float32)[:, None, :, None]
+    colors = numpy.zeros(pyramid.shape[:-3] + points.shape[:-1] + (4,), dtype = numpy.float32)
+    for level, weight in ((low, 1-blend), (numpy.minimum(low+1, len(levels)-1), blend)):
+        if not weight.any():
+            continue
+        widths, heights, offsets = (table[level][:, None, :, None, i] for i in range(3))
+        scaled = numpy.stack([(points[..., 0]+.5)*(widths/base_width) - .5,
+                              (points[..., 1]+.5)*(heights/base_height) - .5], axis = -1)
+        colors += _interpolate(pyramid, scaled, filter, (widths, heights, offsets))*weight[..., None]
+    return _to_bytes(colors.sum(axis = (-4, -2))/(samples*samples))
+
+def _count(stats: dict, name: str, amount: int) -> None:
+    '''
+    Adds amount to the count name in stats, if there are stats.
+    '''
+    if stats != None:
+        stats[name] = stats.get(name, 0) + amount
+
+def _coverage(mapping: rectangles.QuadMapping, xs: numpy.ndarray,
+              ys: numpy.ndarray) -> numpy.ndarray:
+    '''
+    Scanlines the rectangle of mapping over a grid of sample coordinates
+    (all of xs for every one of ys, both sorted), returning a len(ys) x len(xs)
+    array of which samples are in the rectangle, without checking each one.
+    '''
+    starts, ends = mapping.spans(ys)
+    first = numpy.searchsorted(xs, starts, 'left')
+    last = numpy.maximum(first, numpy.searchsorted(xs, ends, 'right'))
+    marks = numpy.zeros((len(ys), len(xs)+1), dtype = numpy.int8)
+    sample_rows = numpy.arange(len(ys))[:, None]
+    numpy.add.at(marks, (sample_rows, first), 1)
+    numpy.add.at(marks, (sample_rows, last), -1)
+    return numpy.cumsum(marks[:, :-1], axis = 1, dtype = numpy.int8) > 0
+
+def _source_points(shape: tuple, xs: numpy.ndarray, ys: numpy.ndarray,
+                   valid: numpy.ndarray) -> numpy.ndarray:
+    '''
+    Same as _source_indices, but for filtering: turns (mapped) coordinates into
+    ... x 2 float32 source points with pixel centers on whole numbers (see
+    _interpolate), with nan for anything invalid or off a source of the given shape.
+    '''
+    with numpy.errstate(invalid = 'ignore'):
+        inside = valid & (xs >= 0) & (xs < shape[1]) & (ys >= 0) & (ys < shape[0])
+    points = numpy.full(xs.shape + (2,), numpy.nan, dtype = numpy.float32)
+    points[inside, 0] = xs[inside] - .5
+    points[inside, 1] = ys[inside] - .5
+    return points
+
+def _average(pixels: numpy.ndarray, indices: numpy.ndarray) -> numpy.ndarray:
+    '''
+    Takes the sample indices (see _sample_indices) of some pixels and returns
+    the average of each pixel's samples, with the ones at -1 counting as blank.
+    '''
+    samples = indices.shape[1]
+    colors = _gather_indices(pixels, indices)
+    return (colors.sum(axis = (-4, -2), dtype = numpy.uint32)//(samples*samples)).astype(numpy.uint8)
+
+def _average_points(pixels: numpy.ndarray, points: numpy.ndarray,
+                    filter: str) -> numpy.ndarray:
+    '''
+    Same as _average, but for sample points (see _sample_indices), each of which
+    is filtered (see _interpolate) instead of just looked up.
+    '''
+    samples = points.shape[1]
+    colors = _interpolate(pixels, points, filter)
+    return _to_bytes(colors.sum(axis = (-4, -2))/(samples*samples))
+
+def _sample_indices(shape: tuple, mapping: rectangles.QuadMapping,
+                    xs: numpy.ndarray, ys: numpy.ndarray, inside: numpy.ndarray,
+                    points: bool = False, stats: dict = None) -> numpy.ndarray:
+    '''
+    Takes the sample coordinates of some pixels (xs is width x samples, ys is
+    height x samples) and which of those samples are inside the rectangle
+    (height x samples x width x samples), and returns where each of them lands
+    in a source of the given shape (see _source_indices), -1 if nowhere.
+    If points, those are fractional points (see _source_points) instead, for
+    filtering, with nan if nowhere.
+    '''
+    mapped_xs, mapped_ys, valid = mapping.map_grid(xs.ravel(), ys.ravel(),
+                                                   inside.reshape(ys.size, xs.size))
+    if not points:
+        found = _source_indices(shape, mapped_xs, mapped_ys, valid)
+        grid = numpy.full(inside.shape, -1, dtype = found.dtype)
+        missed = found < 0
+    else:
+        found = _source_points(shape, mapped_xs, mapped_ys, valid)
+        grid = numpy.full(inside.shape + (2,), numpy.nan, dtype = numpy.float32)
+        missed = numpy.isnan(found[:, 0])
+    grid[inside] = found
+    _count(stats, 'samples', len(found))
+    if stats != None:
+        _count(stats, 'missed_samples', int(numpy.count_nonzero(missed)))
+    return grid
+
+def _resample(pixels: numpy.ndarray, grid: numpy.ndarray,
+              filter: str = NEAREST) -> numpy.ndarray:
+    '''
+    Averages each pixel's samples from where they land (see _sample_indices).
+    '''
+    if filter == NEAREST:
+        return _average(pixels, grid)
+    return _average_points(pixels, grid, filter)
+
+def _supersample(pixels: numpy.ndarray, mapping: rectangles.QuadMapping,
+                 xs: numpy.ndarray, ys: numpy.ndarray, inside: numpy.ndarray,
+                 filter: str = NEAREST, stats: dict = None) -> numpy.ndarray:
+    '''
+    Returns the average of each pixel's samples (see _sample_indices), with
+    the ones not inside counting as blank.
+    '''
+    return _resample(pixels, _sample_indices(pixels.shape[-3:-1], mapping, xs, ys, inside,
+                                             filter != NEAREST, stats), filter)
+
+def _adaptive_colors(pixels: numpy.ndarray, xs: numpy.ndarray, ys: numpy.ndarray,
+                     valid: numpy.ndarray, filter: str) -> numpy.ndarray:
+    '''
+    Reads single (mapped) samples for _adaptive_sample, through filter.
+    '''
+    if filter == NEAREST:
+        return _gather(pixels, xs, ys, valid)
+    return _to_bytes(_interpolate(pixels, _source_points(pixels.shape[:2], xs, ys, valid), filter))
+
+def _adaptive_sample(pixels: numpy.ndarray, mapping: rectangles.QuadMapping,
+                     xs: numpy.ndarray, ys: numpy.ndarray, inside: numpy.ndarray,
+                     threshold: float, filter: str = NEAREST,
+                     stats: dict = None) -> numpy.ndarray:
+    '''
+    Same as _supersample, but a pixel wholly inside the rectangle is just the
+    average of samples at its four corners (which it shares with its
+    neighbours), as long as none of those, or a sample at its middle, is more
+    than threshold off from another in any channel. Only the rest, along with
+    pixels on the rectangle's edge, get all of their samples. That's a check
+    on how much the pixel changes across it, not a bound on how far off the
+    result is: anything small enough to miss all five samples is still missed.
+    '''
+    samples = xs.shape[1]
+    full = inside.sum(axis = (1, 3)) == samples*samples
+    rows, width = full.shape
+
+    corner_xs = numpy.append(xs[:, 0], xs[-1, 0]+1)
+    corner_ys = numpy.append(ys[:, 0], ys[-1, 0]+1)
+    corners_inside = _coverage(mapping, corner_xs, corner_ys)
+    mapped_xs, mapped_ys, valid = mapping.map_grid(corner_xs, corner_ys, corners_inside)
+    corners = numpy.zeros(corners_inside.shape + (4,), dtype = numpy.uint8)
+    corners[corners_inside] = _adaptive_colors(pixels, mapped_xs, mapped_ys, valid, filter)
+    _count(stats, 'samples', len(mapped_xs))
+
+    each = numpy.stack([corners[:-1, :-1], corners[:-1, 1:], corners[1:, :-1], corners[1:, 1:]])
+    low = each.min(axis = 0)
+    high = each.max(axis = 0)
+    simple = full & corners_inside[:-1, :-1] & corners_inside[:-1, 1:] & \
+             corners_inside[1:, :-1] & corners_inside[1:, 1:] & \
+             ((high.astype(numpy.int16)-low).max(axis = 2) <= threshold)
+
+    #Something thin can fit between all four corners, so the middle of the pixel
+    #has to be within threshold of them too
+    middle_rows, middle_cols = numpy.nonzero(simple)
+    if len(middle_rows):
+        middle_xs = (corner_xs[:-1]+corner_xs[1:])/2
+        middle_ys = (corner_ys[:-1]+corner_ys[1:])/2
+        mapped_xs, mapped_ys, valid = mapping.map_array(middle_xs[middle_cols], middle_ys[middle_rows],
+                                                        contained = True)
+        middles = _adaptive_colors(pixels, mapped_xs, mapped_ys, valid, filter)
+        _count(stats, 'samples', len(middles))
+        simple[simple] = (numpy.maximum(high[simple], middles).astype(numpy.int16) -
+                          numpy.minimum(low[simple], middles)).max(axis = 1) <= threshold
+
+    new_pixels = numpy.zeros((rows, width, 4), dtype = numpy.uint8)
+    new_pixels[simple] = each.sum(axis = 0, dtype = numpy.uint16)[simple]//4
+    refine = inside.any(axis = (1, 3)) & ~simple
+    if refine.any():
+        refined = _supersample(pixels, mapping, xs, ys,
+                               inside & refine[:, None, :, None], filter, stats)
+        new_pixels[refine] = refined[refine]
+    return new_pixels
+
+def _render_window(pixels: numpy.ndarray, mapping: rectangles.QuadMapping,
+                   left: int, top: int, width: int, height: int,
+                   alias_amount: float, adaptive: float = None,
+                   filter: str = NEAREST, levels: ((int, int, int),) = None,
+                   stats: dict = None, cache: bool = True,
+                   hidden: numpy.ndarray = None) -> numpy.ndarray:
+    '''
+    Renders the part of a transform from left, top that is width by height
+    pixels, by mapping every sample through mapping into pixels and
+    averaging each pixel's samples. Returns a height x width x 4 array.
+    With filter (BILINEAR or BICUBIC) each sample, taken from the middle of
+    its bit of the pixel, blends the source pixels around where it lands
+    instead of just taking the one it's in (NEAREST).
+    Samples outside of the rectangle are never mapped, they're just blank, and
+    neither are the ones in pixels hidden (a height x width bool array) says
+    can't be seen anyway.
+    With adaptive, most pixels only get one sample (see _adaptive_sample).
+    With levels, pixels is a packed mipmap pyramid (see _pyramid) and levels
+    is the (width, height, offset) of each of its levels, and every pixel
+    reads from the levels that fit how much it shrinks the source.
+    Otherwise, if cache, where every sample lands is kept in the sample cache,
+    so the same window of the same transform again is just a lookup.
+    How long each part takes and how many samples are mapped (see add_hook)
+    is counted in stats. Pixels can also be a
+    stack of same sized images (N x height x width x 4, but not with adaptive),
+    which all get rendered at once for N x height x width x 4 back.
+    '''
+    if filter not in (NEAREST, BILINEAR, BICUBIC):
+        raise ValueError(f'Unknown filter {filter}')
+    if adaptive != None and levels != None:
+        raise ValueError('Adaptive sampling does not work with mipmaps')
+    shape = pixels.shape[-3:-1] if levels == None else levels[0][1::-1]
+    new_pixels = numpy.zeros(pixels.shape[:-3] + (height, width, 4), dtype = numpy.uint8)
+    if width <= 0 or height <= 0:
+        return new_pixels
+
+    centered = filter != NEAREST
+    xs = _sample_coords(left, width, alias_amount, centered)
+    samples = xs.shape[1]
+    band = max(1, _CHUNK_SAMPLES//(width*samples*samples))
+
+    grid = None
+    cache = cache and adaptive == None and levels == None and hidden is None and \
+            _sample_cache.fits(height*samples*width*samples*numpy.dtype(numpy.int64).itemsize)
+    if cache:
+        key = (mapping.key(), shape, left, top, width, height, alias_amount, filter)
+        grid = _sample_cache.get(key)
+        if grid is not None:
+            _count(stats, 'cache_hits', 1)
+            clock = _clock(stats)
+            for y in range(0, height, band):
+                new_pixels[..., y:y+band, :, :] = _resample(pixels, grid[y:y+band], filter)
+            _lap(stats, 'averaging_seconds', clock)
+            return new_pixels
+        if filter == NEAREST:
+            grid = numpy.full((height, samples, width, samples), -1,
+                              dtype = numpy.int32 if shape[0]*shape[1] < 2**31 else numpy.int64)
+        else:
+            grid = numpy.full((height, samples, width, samples, 2), numpy.nan, dtype = numpy.float32)
+
+    for y in range(0, height, band):
+        rows = min(band, height-y)
+        clock = _clock(stats)
+        ys = _sample_coords(top+y, rows, alias_amount, centered)
+        inside = _coverage(mapping, xs.ravel(), ys.ravel())
+        clock = _lap(stats, 'geometry_seconds', clock)
+        if stats != None:
+            _count(stats, 'outside_samples', inside.size - int(numpy.count_nonzero(inside)))
+        if not inside.any():
+            continue
+
+        inside = inside.reshape(rows, samples, width, samples)
+        if hidden is not None:
+            inside &= ~hidden[y:y+rows, None, :, None]
+            if not inside.any():
+                continue
+        if levels != None:
+            points = _sample_indices(shape, mapping, xs, ys, inside, True, stats)
+            lods = _mipmap_lods(mapping, left, top+y, width, rows, alias_amount, len(levels))
+            clock = _lap(stats, 'sampling_seconds', clock)
+            new_pixels[..., y:y+rows, :, :] = _mipmap_average(pixels, levels, points, lods, filter)
+            _lap(stats, 'averaging_seconds', clock)
+        elif adaptive == None:
+            indices = _sample_indices(shape, mapping, xs, ys, inside, filter != NEAREST, stats)
+            if grid is not None:
+                grid[y:y+rows] = indices
+            clock = _lap(stats, 'sampling_seconds', clock)
+            new_pixels[..., y:y+rows, :, :] = _resample(pixels, indices, filter)
+            _lap(stats, 'averaging_seconds', clock)
+        else:
+            new_pixels[y:y+rows] = _adaptive_sample(pixels, mapping, xs, ys, inside,
+                                                    adaptive, filter, stats)
+            _lap(stats, 'sampling_seconds', clock)
+
+    if grid is not None:
+        _sample_cache.put(key, grid)
+    return new_pixels
+
+def _blend_over(pixels: numpy.ndarray, colors: numpy.ndarray) -> None:
+    '''
+    Blends colors (the same shape) over pixels in place by the colors' alpha
+    (the usual "over"), only touching the pixels where that isn't 0.
+    '''
+    drawn = colors[..., 3] != 0
+    new = colors[drawn].astype(numpy.uint32)
+    old = pixels[drawn].astype(numpy.uint32)
+    #Both alphas are kept times 255 so it all stays in integers
+    new_alpha = new[:, 3:]*255
+    old_alpha = old[:, 3:]*(255-new[:, 3:])
+    alpha = new_alpha + old_alpha
+    blended = numpy.empty(new.shape, dtype = numpy.uint8)
+    blended[:, :3] = (new[:, :3]*new_alpha + old[:, :3]*old_alpha + alpha//2)//alpha
+    blended[:, 3:] = (alpha + 127)//255
+    pixels[drawn] = blended
+
+def _tiles(left: int, top: int, width: int, height: int,
+           size: int = None) -> [(int, int, int, int)]:
+    '''
+    Splits a window into (left, top, width, height) tiles of at most size by size.
+    '''
+    size = size or _TILE_SIZE
+    return [(x, y, min(size, left+width-x), min(size, top+height-y))
+            for y in range(top, top+height, size)
+            for x in range(left, left+width, size)]
+
+def _render_tiles(pixels: numpy.ndarray, mapping: rectangles.QuadMapping,
+                  left: int, top: int, width: int, height: int,
+                  workers: int, pool: str = THREADS, stats: dict = None,
+                  **options) -> numpy.ndarray:
+    '''
+    Same as _render_window (options are passed along to it), but splits the
+    window into tiles which are rendered over a pool of workers threads or
+    processes. Pool can also be a _SharedTiles already set up for pixels
+    (and at least this big a window), which is used instead of a new one.
+    '''
+    result_shape = pixels.shape[:-3] + (height, width, 4)
+    if pool == THREADS:
+        new_pixels = numpy.zeros(result_shape, dtype = numpy.uint8)
+
+        def render(tile):
+            x, y, w, h = tile
+            tile_stats = {}
+            new_pixels[..., y-top:y-top+h, x-left:x-left+w, :] = \
+                _render_window(pixels, mapping, x, y, w, h, stats = tile_stats, **options)
+            return tile_stats
+
+        with futures.ThreadPoolExecutor(workers) as executor:
+            all_stats = list(executor.map(render, _tiles(left, top, width, height)))
+
+    elif pool == PROCESSES:
+        with _SharedTiles(pixels, workers, result_shape) as shared:
+            new_pixels, all_stats = shared.render(mapping, left, top, width, height, options)
+
+    elif isinstance(pool, _SharedTiles):
+        new_pixels, all_stats = pool.render(mapping, left, top, width, height, options)
+
+    else:
+        raise ValueError(f'Unknown pool {pool}')
+
+    for tile_stats in all_stats:
+        for name, amount in tile_stats.items():
+            _count(stats, name, amount)
+    return new_pixels
+
+class _SharedTiles:
+    '''
+    A process pool whose workers share a source (see _attach_shared) and a
+    result big enough for result_shape, so any number of windows of the
+    source up to that size can be rendered (see _render_tiles) without
+    copying the source or starting the workers again.
+    '''
+    def __init__(self, pixels: numpy.ndarray, workers: int, result_shape: tuple):
+        self._shape = pixels.shape
+        self._source = None
+        self._result = None
+        self._executor = None
+        try:
+            #A memory mapped source gets mapped again by each worker instead of copied
+            if isinstance(pixels, numpy.memmap) and pixels.mode == 'r' and \
+               isinstance(pixels.base, mmap.mmap) and pixels.filename != None:
+                source_name = (pixels.filename, pixels.offset)
+            else:
+                self._source = shared_memory.SharedMemory(create = True, size = max(1, pixels.nbytes))
+                numpy.ndarray(pixels.shape, numpy.uint8, self._source.buf)[:] = pixels
+                source_name = self._source.name
+            self._result = shared_memory.SharedMemory(create = True, size = max(1, int(numpy.prod(result_shape))))
+            self._executor = futures.ProcessPoolExecutor(workers, initializer = _attach_shared,
+                                                         initargs = (source_name, pixels.shape,
+                                                                     self._result.name))
+        except:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *error):
+        self.close()
+
+    def render(self, mapping: rectangles.QuadMapping, left: int, top: int,
+               width: int, height: int, options: dict) -> (numpy.ndarray, [dict]):
+        '''
+        Renders a window over the workers, returning it and every tile's stats.
+        '''
+        result_shape = self._shape[:-3] + (height, width, 4)
+        all_stats = list(self._executor.map(_render_shared_tile,
+                                            [(mapping, left, top, result_shape, tile, options)
+                                             for tile in _tiles(left, top, width, height)]))
+        return numpy.ndarray(result_shape, numpy.uint8, self._result.buf).copy(), all_stats
+
+    def close(self) -> None:
+        '''
+        Stops the workers and frees the shared memory.
+        '''
+        if self._executor != None:
+            self._executor.shutdown()
+            self._executor = None
+        for memory in (self._source, self._result):
+            if memory != None:
+                memory.close()
+                memory.unlink()
+        self._source = None
+        self._result = None
+
+#The shared source array and result buffer, in a process pool worker
+_shared = None
+
+def _attach_shared(source_name: str or (str, int), source_shape: tuple,
+                   result_name: str) -> None:
+    '''
+    Process pool initializer, attaches to the shared source array and result
+    buffer. The source can also be a (file, offset) to memory map (read only).
+    '''
+    global _shared
+    result = shared_memory.SharedMemory(name = result_name)
+    if isinstance(source_name, tuple):
+        source = None
+        pixels = numpy.memmap(source_name[0], dtype = numpy.uint8, mode = 'r',
+                              offset = source_name[1], shape = source_shape)
+    else:
+        source = shared_memory.SharedMemory(name = source_name)
+        pixels = numpy.ndarray(source_shape, numpy.uint8, source.buf)
+    _shared = (source, pixels, result)
+
+def _render_shared_tile(job: tuple) -> dict:
+    '''
+    Renders one tile in a process pool worker straight into the shared result
+    (result_shape of the front of the buffer), and gives back the tile's stats.
+    '''
+    mapping, left, top, result_shape, (x, y, w, h), options = job
+    _, pixels, result = _shared
+    new_pixels = numpy.ndarray(result_shape, numpy.uint8, result.buf)
+    stats = {}
+    new_pixels[..., y-top:y-top+h, x-left:x-left+w, :] = \
+        _render_window(pixels, mapping, x, y, w, h, stats = stats, cache = False, **options)
+    return stats
 
 
 #Just some testing
@@ -5,6 +5,10 @@
 #
 #Edit History:
 #   [001]   aw  12/21/20    Initial Creation
+#   [002]   ag  10/17/26    Mouse is mapped through precomputed
+#                           rectangle mappings.
+#   [003]   ag  10/17/26    Surfaces come straight from the Images'
+#                           buffers and are put in the display format.
 
 import pygame
 from rectangles import *
@@ -27,6 +31,8 @@ class RectangleApp:
         self._running = True
         self._rect1 = None
         self._rect2 = None
+        self._map1 = None
+        self._map2 = None
         self._mouse = (0,0)
         self._surface = None
         self._base_image = None
@@ -64,6 +70,8 @@ class RectangleApp:
         self._base_image = images.Image.load(_IMAGE)
         self._rect2 = Rectangle(width = self._base_image.width(), 
                                 height = self._base_image.height())
+        self._map1 = self._rect1.mapping(self._rect2)
+        self._map2 = self._rect2.mapping(self._rect1)
 
         self._image = self._base_image.transform(rect = self._rect1, alias_amount=_ALIAS)
 
@@ -76,8 +84,8 @@ class RectangleApp:
 
         self._resize_display((_WIDTH,_HEIGHT))        
 
-        self._base_surface = self._base_image.convert()
-        self._img_surface = self._image.convert()
+        self._base_surface = self._base_image.convert().convert_alpha()
+        self._img_surface = self._image.convert().convert_alpha()
 
 
     def _update_world(self) -> None:
@@ -125,11 +133,11 @@ class RectangleApp:
         self._draw_rect(self._rect1)
         self._draw_rect(self._rect2)
 
-        newpoint = self._rect1.transform(Coordinate(tuple_coord=self._mouse), self._rect2)
+        newpoint = self._map1.map(Coordinate(tuple_coord=self._mouse))
         if newpoint != None:
             pygame.draw.circle(self._surface, _POINT, newpoint.to_tuple(), 5)
 
-        newpoint2 = self._rect2.transform(Coordinate(tuple_coord=self._mouse), self._rect1)
+        newpoint2 = self._map2.map(Coordinate(tuple_coord=self._mouse))
         if newpoint2 != None:
             pygame.draw.circle(self._surface, _POINT, newpoint2.to_tuple(), 5)
         
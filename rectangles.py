@@ -12,12 +12,36 @@
 #Edit History:
 #   [001]   aw  12/21/20    Initial Creation of Coordinate,
 #                           Vector, Line, and Rectangle classes. 
+#   [002]   ag  10/17/26    Added contains_many and transform_many,
+#                           which do the same as contains/transform
+#                           but over whole numpy arrays of points.
+#   [003]   ag  10/17/26    Added QuadMapping and ProjectiveMapping,
+#                           which precompute a rectangle to rectangle
+#                           mapping once for repeated use.
+#   [004]   ag  10/17/26    QuadMapping.spans scanlines the source
+#                           rectangle a row at a time.
+#   [005]   ag  10/17/26    Added MeshMapping, which approximates a
+#                           mapping by interpolating over a grid.
+
+import numpy
+import math
 
 TOPLEFT = 0
 TOPRIGHT = 1
 BOTRIGHT = 2
 BOTLEFT = 3
 
+QUAD = 'quad'
+PROJECTIVE = 'projective'
+
+#Default size of MeshMapping's grid squares and how far off they can be,
+#how many points along each side of one get checked, and how much of the
+#error those points can have (the worst of it is usually between them)
+MESH_CELL = 16
+MESH_ERROR = .25
+MESH_PROBES = 4
+MESH_MARGIN = .5
+
 class Coordinate:
     def __init__(self, x: float = 0, y: float = 0,
                 tuple_coord: tuple = None):
@@ -383,6 +407,553 @@ class Rectangle:
 
         return None
 
+    def edges(self) -> [(float, float, float, float)]:
+        '''
+        Returns each line as a tuple of (x, y, vector x, vector y).
+        '''
+        return [(i._point.x, i._point.y, i._vector.x, i._vector.y) for i in self._lines]
+
+    def contains_many(self, xs: numpy.ndarray, ys: numpy.ndarray) -> numpy.ndarray:
+        '''
+        Like contains, but takes arrays of x and y values and returns
+        a boolean array of whether each of those points is in the rectangle.
+        '''
+        return _contains_many(self.edges(), xs, ys)
+
+    def mapping(self, rect: 'Rectangle', mode: str = QUAD) -> 'QuadMapping':
+        '''
+        Returns a mapping from this rectangle to rect, which does what transform
+        does but with the geometry worked out once up front. Mode is QUAD for
+        the same mapping as transform, or PROJECTIVE for a perspective one.
+        '''
+        if mode == QUAD:
+            return QuadMapping(self, rect)
+        elif mode == PROJECTIVE:
+            return ProjectiveMapping(self, rect)
+        raise ValueError(f'Unknown mapping mode {mode}')
+
+    def transform_many(self, xs: numpy.ndarray, ys: numpy.ndarray,
+                       rect: 'Rectangle') -> (numpy.ndarray, numpy.ndarray, numpy.ndarray):
+        '''
+        Like transform, but takes arrays of x and y values. Returns the
+        arrays of transformed x and y values along with a boolean array of
+        which of those are valid (the ones transform wouldn't give None for).
+        Invalid points are nan.
+        '''
+        return self.mapping(rect).map_array(xs, ys)
+
+
+
+class QuadMapping:
+    '''
+    Rectangle.transform from one rectangle (source) to another (dest), but
+    with the edges, slopes and lengths all worked out once. Note that this
+    copies the geometry, so moving either rectangle afterwards won't change
+    the mapping.
+    '''
+    def __init__(self, source: Rectangle, dest: Rectangle):
+        self._edges = source.edges()
+        self._dest_edges = dest.edges()
+        self._topleft = self._edges[0][:2]
+        self._dest_topleft = self._dest_edges[0][:2]
+
+        #The lines created by topright and bottomright, then bottomright and bottomleft
+        self._far_edges = []
+        for i in range(1, len(self._edges)-1):
+            x, y, vx, vy = self._edges[i]
+            unit = Vector(vx, vy).unit()
+            self._far_edges.append((x, y, vx, vy,
+                                    vy/vx if vx != 0 else None,
+                                    unit.x, unit.y,
+                                    (vx**2+vy**2)**.5,
+                                    self._dest_edges[i]))
+
+    def key(self) -> tuple:
+        '''
+        Returns a (hashable) tuple of everything that decides this mapping.
+        '''
+        return (type(self).__name__, tuple(self._edges), tuple(self._dest_edges))
+
+    def contains(self, point: Coordinate) -> bool:
+        '''
+        Same as Rectangle.contains on the source rectangle.
+        '''
+        x = point.x
+        y = point.y
+        intersections = 0
+
+        for px, py, vx, vy in self._edges:
+            if vx == 0:
+                if px == x:
+                    return True
+            elif y == vy/vx*(x-px) + py:
+                return True
+
+            if vy == 0 or y >= max(py, py+vy) or y < min(py, py+vy) or \
+               x < min(px, px+vx):
+                continue
+
+            m = vy/vx if vx != 0 else None
+            intersection_x = px if m == None else (y-py+m*px)/m
+            if intersection_x < x:
+                intersections += 1
+
+        return intersections%2 == 1
+
+    def contains_array(self, xs: numpy.ndarray, ys: numpy.ndarray) -> numpy.ndarray:
+        '''
+        Same as Rectangle.contains_many on the source rectangle.
+        '''
+        return _contains_many(self._edges, xs, ys)
+
+    def spans(self, ys: numpy.ndarray) -> (numpy.ndarray, numpy.ndarray):
+        '''
+        Scanlines source. Takes an array of y values and returns two len(ys) x 3
+        arrays, the starts and ends of the (closed) x ranges of each row that are
+        in source. Unused ranges have a start after their end.
+        '''
+        return _row_spans(self._edges, ys)
+
+    def map(self, point: Coordinate) -> Coordinate:
+        '''
+        Same as Rectangle.transform from source to dest.
+        '''
+        if not self.contains(point):
+            return None
+
+        x = point.x
+        y = point.y
+        for i in range(len(self._edges)):
+            if x == self._edges[i][0] and y == self._edges[i][1]:
+                return Coordinate(self._dest_edges[i][0], self._dest_edges[i][1])
+
+        tx, ty = self._topleft
+        dx = x-tx
+        dy = y-ty
+        topleft_dist = (dx**2+dy**2)**.5
+        unit_x = dx/topleft_dist
+        unit_y = dy/topleft_dist
+
+        for px, py, vx, vy, m2, unit2_x, unit2_y, length, line2 in self._far_edges:
+            if (unit_x == unit2_x and unit_y == unit2_y) or \
+               (-unit_x == unit2_x and -unit_y == unit2_y):
+                continue
+
+            if tx == px and ty == py:
+                ix, iy = tx, ty
+            elif dx == 0:
+                ix = tx
+                iy = m2*(ix-px)+py
+            elif vx == 0:
+                ix = px
+                iy = dy/dx*(ix-tx)+ty
+            else:
+                m1 = dy/dx
+                if m1 == m2:
+                    continue
+                ix = (py-ty+m1*tx-m2*px)/(m1-m2)
+                iy = m1*(ix-tx)+ty
+
+            dist_percent = ((ix-px)**2+(iy-py)**2)**.5/length
+            if dist_percent > 1:
+                continue
+            topleft_percent = topleft_dist/((tx-ix)**2+(ty-iy)**2)**.5
+
+            t2x, t2y = self._dest_topleft
+            point2_x = line2[0]+line2[2]*dist_percent
+            point2_y = line2[1]+line2[3]*dist_percent
+            return Coordinate(t2x+(point2_x-t2x)*topleft_percent,
+                              t2y+(point2_y-t2y)*topleft_percent)
+
+        return None
+
+    def map_array(self, xs: numpy.ndarray, ys: numpy.ndarray,
+                  contained: bool = False) -> (numpy.ndarray, numpy.ndarray, numpy.ndarray):
+        '''
+        Same as Rectangle.transform_many from source to dest. If contained, the
+        points are already known to be in source (say, from spans), and
+        aren't checked again.
+        '''
+        xs, ys = numpy.broadcast_arrays(numpy.asarray(xs, dtype = float),
+                                        numpy.asarray(ys, dtype = float))
+        new_xs = numpy.full(xs.shape, numpy.nan)
+        new_ys = numpy.full(xs.shape, numpy.nan)
+        todo = numpy.ones(xs.shape, dtype = bool) if contained else self.contains_array(xs, ys)
+        valid = numpy.zeros(xs.shape, dtype = bool)
+
+        #Points right on a vertex go straight to the other vertex
+        for i in range(len(self._edges)):
+            hit = todo & (xs == self._edges[i][0]) & (ys == self._edges[i][1])
+            new_xs[hit] = self._dest_edges[i][0]
+            new_ys[hit] = self._dest_edges[i][1]
+            valid |= hit
+            todo &= ~hit
+
+        tx, ty = self._topleft
+        t2x, t2y = self._dest_topleft
+        dx = xs-tx
+        dy = ys-ty
+
+        with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+            topleft_dist = (dx**2+dy**2)**.5
+            unit_x = dx/topleft_dist
+            unit_y = dy/topleft_dist
+            m1 = dy/dx
+
+            for px, py, vx, vy, m2, unit2_x, unit2_y, length, line2 in self._far_edges:
+                parallel = ((unit_x == unit2_x) & (unit_y == unit2_y)) | \
+                           ((-unit_x == unit2_x) & (-unit_y == unit2_y))
+
+                if tx == px and ty == py:
+                    x = numpy.full(xs.shape, float(tx))
+                    y = numpy.full(xs.shape, float(ty))
+                elif vx == 0:
+                    x = numpy.where(dx == 0, tx, px)
+                    y = m1*(x-tx)+ty
+                else:
+                    parallel |= (dx != 0) & (m1 == m2)
+                    x = numpy.where(dx == 0, tx, (py-ty+m1*tx-m2*px)/(m1-m2))
+                    y = numpy.where(dx == 0, m2*(x-px)+py, m1*(x-tx)+ty)
+
+                dist_percent = ((x-px)**2+(y-py)**2)**.5/length
+                hit = todo & ~parallel & (dist_percent <= 1)
+                topleft_percent = topleft_dist/((tx-x)**2+(ty-y)**2)**.5
+
+                point2_x = line2[0]+line2[2]*dist_percent
+                point2_y = line2[1]+line2[3]*dist_percent
+                new_x = t2x+(point2_x-t2x)*topleft_percent
+                new_y = t2y+(point2_y-t2y)*topleft_percent
+
+                new_xs[hit] = new_x[hit]
+                new_ys[hit] = new_y[hit]
+                valid |= hit
+                todo &= ~hit
+
+        return new_xs, new_ys, valid
+
+    def map_grid(self, xs: numpy.ndarray, ys: numpy.ndarray,
+                 inside: numpy.ndarray) -> (numpy.ndarray, numpy.ndarray, numpy.ndarray):
+        '''
+        Same as map_array with contained, but for the points of a grid (every
+        one of xs, sorted, for every one of ys, sorted) that are inside
+        (len(ys) x len(xs)), in the order numpy.nonzero gives them.
+        '''
+        rows, columns = numpy.nonzero(inside)
+        return self.map_array(xs[columns], ys[rows], contained = True)
+
+
+class ProjectiveMapping(QuadMapping):
+    '''
+    A perspective (homography) mapping from source to dest, which sends the
+    four corners to the four corners like QuadMapping, but keeps straight
+    lines straight in between. Best for quadrilaterals that are really a
+    flat rectangle seen at an angle. Only points inside source are mapped.
+    '''
+    def __init__(self, source: Rectangle, dest: Rectangle):
+        QuadMapping.__init__(self, source, dest)
+        a = []
+        b = []
+        for (x, y, _, _), (u, v, _, _) in zip(self._edges, self._dest_edges):
+            a.append([x, y, 1, 0, 0, 0, -u*x, -u*y])
+            a.append([0, 0, 0, x, y, 1, -v*x, -v*y])
+            b.extend([u, v])
+        self._matrix = numpy.append(numpy.linalg.solve(numpy.array(a, dtype = float),
+                                                       numpy.array(b, dtype = float)), 1).reshape(3,3)
+
+    def map(self, point: Coordinate) -> Coordinate:
+        '''
+        Maps point from source to dest, returning None if it isn't in source.
+        '''
+        if not self.contains(point):
+            return None
+        h = self._matrix
+        w = h[2,0]*point.x + h[2,1]*point.y + h[2,2]
+        if w == 0:
+            return None
+        return Coordinate(float((h[0,0]*point.x + h[0,1]*point.y + h[0,2])/w),
+                          float((h[1,0]*point.x + h[1,1]*point.y + h[1,2])/w))
+
+    def map_array(self, xs: numpy.ndarray, ys: numpy.ndarray,
+                  contained: bool = False) -> (numpy.ndarray, numpy.ndarray, numpy.ndarray):
+        '''
+        Same as map, but over arrays of x and y values, returning the mapped
+        x and y values and which of them are valid (invalid ones are nan).
+        If contained, the points are already known to be in source.
+        '''
+        xs, ys = numpy.broadcast_arrays(numpy.asarray(xs, dtype = float),
+                                        numpy.asarray(ys, dtype = float))
+        h = self._matrix
+        with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+            w = h[2,0]*xs + h[2,1]*ys + h[2,2]
+            valid = w != 0
+            if not contained:
+                valid &= self.contains_array(xs, ys)
+            new_xs = numpy.where(valid, (h[0,0]*xs + h[0,1]*ys + h[0,2])/w, numpy.nan)
+            new_ys = numpy.where(valid, (h[1,0]*xs + h[1,1]*ys + h[1,2])/w, numpy.nan)
+        return new_xs, new_ys, valid
+
+
+class MeshMapping:
+    '''
+    An approximation of another mapping (a QuadMapping or ProjectiveMapping),
+    which only really maps the corners of a grid of cell by cell squares over
+    source, and bilinearly interpolates everything in between. Any square
+    where that's more than max_error off is split in half both ways, over
+    and over, down to min_cell. That's checked on a MESH_PROBES times finer
+    grid, against MESH_MARGIN of max_error so that what's in between those
+    points stays under it too (it's still a check, not a proof). Points in
+    squares that still aren't close enough then (like right by the corner
+    the QUAD mapping bends around) just get mapped exactly.
+    '''
+    def __init__(self, mapping: QuadMapping, cell: float = MESH_CELL,
+                 max_error: float = MESH_ERROR, min_cell: float = 1):
+        self._mapping = mapping
+        self._cell = cell
+        self._max_error = max_error
+        self._min_cell = min_cell
+
+        xs = [x for x, _, _, _ in mapping._edges]
+        ys = [y for _, y, _, _ in mapping._edges]
+        self._left = math.floor(min(xs))
+        self._top = math.floor(min(ys))
+        self._columns = max(1, math.ceil((max(xs)-self._left)/cell))
+        self._rows = max(1, math.ceil((max(ys)-self._top)/cell))
+
+        #The corners of every square (as x + y*1j, so both are one lookup),
+        #which is all most points need
+        grid_xs, grid_ys, _ = mapping.map_array(self._left + numpy.arange(self._columns+1)[None, :]*cell,
+                                                self._top + numpy.arange(self._rows+1)[:, None]*cell,
+                                                contained = True)
+        self._grid = grid_xs + grid_ys*1j
+
+        #Each square's number of splits along each side and where its corners
+        #start in the nodes, with 0 splits for squares that are mapped exactly
+        count = self._columns*self._rows
+        self._splits = numpy.zeros(count, dtype = numpy.intp)
+        self._offsets = numpy.zeros(count, dtype = numpy.intp)
+        nodes = [numpy.zeros((0, 2))]
+        offset = 0
+
+        todo = numpy.arange(count)
+        splits = 1
+        while len(todo) and cell/splits >= min_cell:
+            #Checks MESH_PROBES points along each side of each part, and everywhere
+            #in between, against what interpolating the parts' corners gives
+            size = MESH_PROBES*splits + 1
+            steps = numpy.arange(size)/MESH_PROBES
+            parts = numpy.minimum(steps.astype(int), splits-1)
+            weights = numpy.zeros((size, splits+1))
+            weights[numpy.arange(size), parts] = 1 - (steps-parts)
+            weights[numpy.arange(size), parts+1] += steps-parts
+
+            lefts = self._left + todo % self._columns*cell
+            tops = self._top + todo // self._columns*cell
+            exact_xs, exact_ys, _ = mapping.map_array(lefts[:, None, None] + steps[None, None, :]*cell/splits,
+                                                      tops[:, None, None] + steps[None, :, None]*cell/splits,
+                                                      contained = True)
+            corner_xs = exact_xs[:, ::MESH_PROBES, ::MESH_PROBES]
+            corner_ys = exact_ys[:, ::MESH_PROBES, ::MESH_PROBES]
+            with numpy.errstate(invalid = 'ignore'):
+                error = numpy.hypot(weights @ corner_xs @ weights.T - exact_xs,
+                                    weights @ corner_ys @ weights.T - exact_ys)
+                close = (error <= max_error*MESH_MARGIN).all(axis = (1, 2))
+
+            done = todo[close]
+            self._splits[done] = splits
+            self._offsets[done] = offset + numpy.arange(len(done))*(splits+1)**2
+            nodes.append(numpy.stack([corner_xs[close], corner_ys[close]], axis = -1).reshape(-1, 2))
+            offset += len(done)*(splits+1)**2
+            #Squares hanging off source won't ever get any closer, so they're left exact
+            todo = todo[~close & numpy.isfinite(error).all(axis = (1, 2))]
+            splits *= 2
+
+        #Nodes are x, y pairs so that each corner is one lookup
+        self._nodes = numpy.concatenate(nodes)
+
+    def key(self) -> tuple:
+        '''
+        Returns a (hashable) tuple of everything that decides this mapping.
+        '''
+        return (type(self).__name__, self._mapping.key(), self._cell, self._max_error, self._min_cell)
+
+    def contains(self, point: Coordinate) -> bool:
+        return self._mapping.contains(point)
+
+    def contains_array(self, xs: numpy.ndarray, ys: numpy.ndarray) -> numpy.ndarray:
+        return self._mapping.contains_array(xs, ys)
+
+    def spans(self, ys: numpy.ndarray) -> (numpy.ndarray, numpy.ndarray):
+        return self._mapping.spans(ys)
+
+    def map(self, point: Coordinate) -> Coordinate:
+        '''
+        Maps point (approximately) from source to dest, or None if it can't be.
+        '''
+        new_xs, new_ys, valid = self.map_array(numpy.array([point.x]), numpy.array([point.y]))
+        if not valid[0]:
+            return None
+        return Coordinate(float(new_xs[0]), float(new_ys[0]))
+
+    def map_array(self, xs: numpy.ndarray, ys: numpy.ndarray,
+                  contained: bool = False) -> (numpy.ndarray, numpy.ndarray, numpy.ndarray):
+        '''
+        Same as the exact mapping's map_array, but interpolated from the grid.
+        '''
+        xs, ys = numpy.broadcast_arrays(numpy.asarray(xs, dtype = float),
+                                        numpy.asarray(ys, dtype = float))
+        inside = numpy.ones(xs.shape, dtype = bool) if contained else self.contains_array(xs, ys)
+        grid_xs = (xs-self._left)/self._cell
+        grid_ys = (ys-self._top)/self._cell
+        columns = numpy.minimum(numpy.clip(grid_xs, 0, self._columns).astype(numpy.intp), self._columns-1)
+        rows = numpy.minimum(numpy.clip(grid_ys, 0, self._rows).astype(numpy.intp), self._rows-1)
+        squares = rows*self._columns + columns
+
+        #Only points on the grid, in squares that got close enough, are interpolated.
+        #The rest (including ones contains_array lets through off past the
+        #rectangle's corners) are mapped exactly
+        near = inside & (grid_xs >= 0) & (grid_xs <= self._columns) & \
+               (grid_ys >= 0) & (grid_ys <= self._rows) & (self._splits[squares] > 0)
+        new_xs = numpy.full(xs.shape, numpy.nan)
+        new_ys = numpy.full(xs.shape, numpy.nan)
+        valid = near.copy()
+
+        #Which part of its square each point is in, and where in that part
+        squares = squares[near]
+        columns = columns[near]
+        rows = rows[near]
+        splits = self._splits[squares]
+        part_xs = (grid_xs[near]-columns)*splits
+        part_ys = (grid_ys[near]-rows)*splits
+        part_columns = numpy.minimum(part_xs.astype(numpy.intp), splits-1)
+        part_rows = numpy.minimum(part_ys.astype(numpy.intp), splits-1)
+        tx = (part_xs-part_columns)[:, None]
+        ty = (part_ys-part_rows)[:, None]
+        corner = self._offsets[squares] + part_rows*(splits+1) + part_columns
+
+        top = self._nodes[corner]
+        top += tx*(self._nodes[corner+1]-top)
+        bottom = self._nodes[corner+splits+1]
+        bottom += tx*(self._nodes[corner+splits+2]-bottom)
+        top += ty*(bottom-top)
+        new_xs[near] = top[:, 0]
+        new_ys[near] = top[:, 1]
+
+        exact = inside & ~near
+        if exact.any():
+            new_xs[exact], new_ys[exact], valid[exact] = self._mapping.map_array(xs[exact], ys[exact],
+                                                                                 contained = True)
+        return new_xs, new_ys, valid
+
+    def map_grid(self, xs: numpy.ndarray, ys: numpy.ndarray,
+                 inside: numpy.ndarray) -> (numpy.ndarray, numpy.ndarray, numpy.ndarray):
+        '''
+        Same as QuadMapping.map_grid, which is where this is really fast: every
+        row of the grid is just a straight line of squares, so the corners
+        only need interpolating down to each row once, and then along it. Only
+        points in split (or exact) squares, or off the grid, go through map_array.
+        '''
+        grid_xs = (xs-self._left)/self._cell
+        grid_ys = (ys-self._top)/self._cell
+        on_xs = (grid_xs >= 0) & (grid_xs <= self._columns)
+        on_ys = (grid_ys >= 0) & (grid_ys <= self._rows)
+        grid_xs = numpy.clip(grid_xs, 0, self._columns)
+        grid_ys = numpy.clip(grid_ys, 0, self._rows)
+        columns = numpy.minimum(grid_xs.astype(numpy.intp), self._columns-1)
+        rows = numpy.minimum(grid_ys.astype(numpy.intp), self._rows-1)
+        ty = (grid_ys-rows)[:, None]
+
+        #Where each row crosses each column of squares, and how fast it goes across
+        row = self._grid[rows] + ty*(self._grid[rows+1]-self._grid[rows])
+        starts = row[:, :-1].ravel()
+        slopes = (row[:, 1:]-row[:, :-1]).ravel()
+        #Points in squares that were split (or are exact), or off the grid, go through map_array
+        other = ((self._splits.reshape(self._rows, self._columns)[rows] != 1) | ~on_ys[:, None]).ravel()
+
+        point_rows, point_columns = numpy.nonzero(inside)
+        crossings = point_rows*self._columns + columns[point_columns]
+        mapped = starts[crossings] + (grid_xs-columns)[point_columns]*slopes[crossings]
+        new_xs = mapped.real.copy()
+        new_ys = mapped.imag.copy()
+        valid = numpy.ones(new_xs.shape, dtype = bool)
+
+        other = other[crossings] | ~on_xs[point_columns]
+        if other.any():
+            new_xs[other], new_ys[other], valid[other] = self.map_array(xs[point_columns[other]],
+                                                                        ys[point_rows[other]],
+                                                                        contained = True)
+        return new_xs, new_ys, valid
+
+
+def _contains_many(edges: [(float, float, float, float)],
+                   xs: numpy.ndarray, ys: numpy.ndarray) -> numpy.ndarray:
+    '''
+    Rectangle.contains over arrays of points, for a rectangle given
+    by its edges (see Rectangle.edges).
+    '''
+    xs, ys = numpy.broadcast_arrays(numpy.asarray(xs, dtype = float),
+                                    numpy.asarray(ys, dtype = float))
+    on_line = numpy.zeros(xs.shape, dtype = bool)
+    odd = numpy.zeros(xs.shape, dtype = bool)
+
+    with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+        for px, py, vx, vy in edges:
+            if vx == 0:
+                on_line |= xs == px
+            else:
+                m = vy/vx
+                on_line |= ys == m*(xs-px) + py
+
+            #Horizontal lines never get crossed by the ray
+            if vy == 0:
+                continue
+
+            crossed = (ys < max(py, py+vy)) & (ys >= min(py, py+vy)) & \
+                      (xs >= min(px, px+vx))
+            if vx == 0:
+                intersection_x = numpy.full(xs.shape, float(px))
+            else:
+                intersection_x = (ys-py+m*px)/m
+            odd ^= crossed & (intersection_x < xs)
+
+    return on_line | odd
+
+
+def _row_spans(edges: [(float, float, float, float)],
+               ys: numpy.ndarray) -> (numpy.ndarray, numpy.ndarray):
+    '''
+    For a rectangle given by its edges, returns the starts and ends of the closed
+    x ranges of each row in ys that are in the rectangle (see QuadMapping.spans).
+    These are the ranges between each pair of crossings of the same ray
+    contains uses, plus any horizontal edge lying on the row.
+    '''
+    ys = numpy.asarray(ys, dtype = float)
+    crossings = []
+    flat_starts = numpy.full(ys.shape, numpy.inf)
+    flat_ends = numpy.full(ys.shape, -numpy.inf)
+
+    for px, py, vx, vy in edges:
+        if vy == 0:
+            on_row = ys == py
+            flat_starts = numpy.where(on_row, numpy.minimum(flat_starts, min(px, px+vx)), flat_starts)
+            flat_ends = numpy.where(on_row, numpy.maximum(flat_ends, max(px, px+vx)), flat_ends)
+            continue
+
+        crossed = (ys < max(py, py+vy)) & (ys >= min(py, py+vy))
+        if vx == 0:
+            x = numpy.full(ys.shape, float(px))
+        else:
+            m = vy/vx
+            x = (ys-py+m*px)/m
+        crossings.append(numpy.where(crossed, x, numpy.inf))
+
+    #Rows without all four crossings get the rest at infinity, which sorts them last
+    crossings += [numpy.full(ys.shape, numpy.inf)]*(4-len(crossings))
+    crossings = numpy.sort(numpy.stack(crossings, axis = -1), axis = -1)
+    starts = numpy.stack([crossings[..., 0], crossings[..., 2], flat_starts], axis = -1)
+    ends = numpy.stack([crossings[..., 1], crossings[..., 3], flat_ends], axis = -1)
+    #A crossing without a partner isn't a span
+    starts[numpy.isinf(ends)] = numpy.inf
+    return starts, ends
 
 
 def compare_all(items: list, f: 'function'):